@@ -1,10 +1,12 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from database.models import Base
+from database.migrations import migrate
 
 #Sqlite db
 engine = create_engine("sqlite:///../database/database.db", echo=True)
 Base.metadata.create_all(engine)
+migrate(engine)
 
 #create session
 Session = sessionmaker(bind=engine)
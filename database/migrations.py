@@ -0,0 +1,59 @@
+"""
+Schema migrations for databases created before a column existed. Run at startup from
+database/db.py; every step is idempotent.
+
+To migrate a database file directly (from the repo root):
+    python -m database.migrations database/database.db
+"""
+import sys
+from sqlalchemy import create_engine, inspect
+
+# Millisecond stamps: ORM writes (func.now()) only have whole seconds and are restamped here,
+# so a later write always compares greater (catalog_export.py relies on it)
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+WATERMARK_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_colognes_updated_at ON colognes(updated_at)",
+    f"""CREATE TRIGGER IF NOT EXISTS colognes_touch_insert AFTER INSERT ON colognes
+        WHEN NEW.updated_at IS NULL OR length(NEW.updated_at) <= 19
+        BEGIN UPDATE colognes SET updated_at = {NOW} WHERE id = NEW.id; END""",
+    f"""CREATE TRIGGER IF NOT EXISTS colognes_touch_update AFTER UPDATE ON colognes
+        WHEN NEW.updated_at IS OLD.updated_at OR length(NEW.updated_at) <= 19
+        BEGIN UPDATE colognes SET updated_at = {NOW} WHERE id = NEW.id; END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cologne_notes_touch_insert AFTER INSERT ON cologne_notes
+        BEGIN UPDATE colognes SET updated_at = {NOW} WHERE id = NEW.cologne_id; END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cologne_notes_touch_delete AFTER DELETE ON cologne_notes
+        BEGIN UPDATE colognes SET updated_at = {NOW} WHERE id = OLD.cologne_id; END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cologne_notes_touch_update AFTER UPDATE ON cologne_notes
+        BEGIN UPDATE colognes SET updated_at = {NOW} WHERE id IN (OLD.cologne_id, NEW.cologne_id); END""",
+    # a deleted row can't carry a stamp, so deletes are logged with one
+    "CREATE TABLE IF NOT EXISTS colognes_deleted (id INTEGER NOT NULL, deleted_at DATETIME NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_colognes_deleted_deleted_at ON colognes_deleted(deleted_at)",
+    f"""CREATE TRIGGER IF NOT EXISTS colognes_log_delete AFTER DELETE ON colognes
+        BEGIN INSERT INTO colognes_deleted (id, deleted_at) VALUES (OLD.id, {NOW}); END""",
+]
+
+def add_updated_at(conn):
+    """
+    colognes.updated_at, the triggers that keep it current and the colognes_deleted log;
+    existing rows are stamped now.
+    """
+    cols = {c['name'] for c in inspect(conn).get_columns('colognes')}
+    if 'updated_at' not in cols:
+        conn.exec_driver_sql("ALTER TABLE colognes ADD COLUMN updated_at DATETIME")
+    for stmt in WATERMARK_DDL:
+        conn.exec_driver_sql(stmt)
+    conn.exec_driver_sql(f"UPDATE colognes SET updated_at = {NOW} WHERE updated_at IS NULL")
+
+MIGRATIONS = [add_updated_at]
+
+def migrate(engine):
+    with engine.begin() as conn:
+        for step in MIGRATIONS:
+            step(conn)
+
+if __name__ == '__main__':
+    from database.models import Base
+    engine = create_engine(f"sqlite:///{sys.argv[1]}")
+    Base.metadata.create_all(engine)
+    migrate(engine)
+    print(f"migrated {sys.argv[1]}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, Table, String, ARRAY, Enum, JSON
+from sqlalchemy import Column, ForeignKey, Integer, Table, String, ARRAY, Enum, JSON, DateTime, func
 from sqlalchemy.orm import relationship, declarative_base
 import enum
 
@@ -62,6 +62,9 @@ class Cologne(Base):
 
     url = Column(String)
 
+    # Watermark for incremental catalog exports (src/Modelling/catalog_export.py)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), index=True)
+
     # Relationships - Fixed the relationship name
     cologne_notes = relationship("CologneNote", back_populates="cologne", cascade="all, delete-orphan")
 
@@ -0,0 +1,79 @@
+"""
+Cold start benchmark: import time and worker start time for the serving bundle vs. the notebook stack.
+
+Each measurement runs in a fresh interpreter so module caches don't leak between runs.
+
+Usage (from src/Benchmarks):
+    python cold_start.py --runs 5
+"""
+import json, sys, subprocess, argparse, statistics
+from pathlib import Path
+
+MODELLING = Path(__file__).resolve().parent.parent/'Modelling'
+
+# Each snippet prints a JSON dict of timings in seconds.
+BUNDLE_SNIPPET = """
+import time, json
+t0 = time.perf_counter()
+from recommender import Recommender
+t1 = time.perf_counter()
+rec = Recommender.load()
+t2 = time.perf_counter()
+rec.recommend_records({"liked_accords_ranked": [{"name": "woody", "rank": 1}, {"name": "citrus", "rank": 2}]}, mode="ae")
+t3 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "load_s": t2 - t1, "first_request_s": t3 - t2}))
+"""
+
+LEGACY_SNIPPET = """
+import time, json
+t0 = time.perf_counter()
+import numpy as np, pandas as pd, torch
+from joblib import load
+from sklearn.neighbors import NearestNeighbors
+from sklearn.decomposition import TruncatedSVD
+import explanations
+from openai import OpenAI
+t1 = time.perf_counter()
+from pathlib import Path
+ART = Path('../../data/processed')
+svd_pipe = load(ART/'svd_pipe.joblib'); knn_svd = load(ART/'svd_knn.joblib'); knn_ae = load(ART/'ae_knn.joblib')
+state = torch.load(ART/'ae.pt', map_location='cpu')
+Z_ae = np.load(ART/'ae_embeddings.npy'); Z_svd = np.load(ART/'svd_embeddings.npy')
+items = pd.read_parquet(ART/'items.parquet'); bridge = pd.read_parquet(ART/'fragrance_note_bridge.parquet')
+explanations.get_client()
+t2 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "load_s": t2 - t1}))
+"""
+
+def run(snippet: str) -> dict:
+    out = subprocess.run([sys.executable, '-c', snippet], cwd=MODELLING, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr else 'benchmark failed')
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def bench(name: str, snippet: str, runs: int) -> dict:
+    try:
+        samples = [run(snippet) for _ in range(runs)]
+    except RuntimeError as e:
+        print(f"[{name}] skipped: {e}")
+        return {}
+    summary = {k: statistics.median(s[k] for s in samples) for k in samples[0]}
+    summary['worker_start_s'] = summary['import_s'] + summary['load_s']
+    print(f"[{name}] " + ', '.join(f"{k}={v*1000:.1f}ms" for k, v in summary.items()))
+    return summary
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5, help='Fresh interpreters per measurement (median is reported).')
+    ap.add_argument("--out", type=Path, default=None, help='Optional JSON file for the results.')
+    args = ap.parse_args()
+
+    results = {
+        'bundle': bench('bundle', BUNDLE_SNIPPET, args.runs),
+        'legacy': bench('legacy', LEGACY_SNIPPET, args.runs),
+    }
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Database -> X_sparse benchmark: the current route (JSON decode per row, CSV hop, pandas +
+MultiLabelBinarizer as in Data Cleaning.ipynb) vs. catalog_export.py (partitioned parquet with
+note/accord ids, CSR built from the list columns), plus an incremental export after touching
+a share of the rows.
+
+Without --db, a database with the models.py schema is generated from items.parquet and
+fragrance_note_bridge.parquet (the full ~20k catalog).
+
+Usage (from src/Benchmarks):
+    python db_to_features.py --touch 0.01
+"""
+import os, sys, csv, json, time, random, sqlite3, argparse, tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+MODELLING = ROOT/'src'/'Modelling'
+sys.path.insert(0, str(MODELLING))
+sys.path.insert(0, str(ROOT))
+os.chdir(MODELLING)  # ART is relative to src/Modelling
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from catalog_export import (export_catalog, catalog_matrix, l2_row_normalize_csr, z_score, VOTE_COLS,
+                            W_NOTE, W_ACCORD, W_META, ACCORD_POS_WEIGHTS)
+
+ART = Path('../../data/processed')
+
+def build_database(path: Path, seed: int = 42):
+    """models.py schema filled from the processed catalog; vote counts are random."""
+    from sqlalchemy import create_engine
+    from database.models import Base
+    from database.migrations import migrate
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    migrate(engine)   # updated_at triggers stamp the raw inserts below
+    items = pd.read_parquet(ART/'items.parquet')
+    bridge = pd.read_parquet(ART/'fragrance_note_bridge.parquet')
+    rng = random.Random(seed)
+
+    notes = sorted(set(bridge['note'].astype(str)))
+    note_id = {n: i + 1 for i, n in enumerate(notes)}
+    by_item = {fid: g for fid, g in bridge.groupby('fragrance_id', sort=False)}
+
+    colognes, links = [], []
+    for cid, r in enumerate(items.itertuples(index=False), start=1):
+        g = by_item.get(r.fragrance_id)
+        levels = {lvl: ([] if g is None else g.loc[g['level'] == lvl, 'note'].astype(str).tolist())
+                  for lvl in ('top', 'mid', 'base')}
+        accords = [str(a) for a in (r.mainaccord1, r.mainaccord2, r.mainaccord3, r.mainaccord4, r.mainaccord5)
+                   if isinstance(a, str) and a.strip()]
+        colognes.append((cid, str(r.Perfume), str(r.Brand), int(r.Year), json.dumps(accords),
+                         json.dumps(levels['top']), json.dumps(levels['mid']), json.dumps(levels['base']), json.dumps([]),
+                         *[rng.randint(0, 500) for _ in VOTE_COLS], str(r.url)))
+        for lvl, typ in (('top', 'TOP'), ('mid', 'MIDDLE'), ('base', 'BASE')):
+            links.extend((cid, note_id[n], typ) for n in levels[lvl])
+
+    con = sqlite3.connect(str(path))
+    with con:
+        con.executemany("INSERT INTO notes (id, name) VALUES (?, ?)", [(i, n) for n, i in note_id.items()])
+        cols = ["id", "name", "brand", "launch_year", "main_accords", "top_notes", "middle_notes", "base_notes",
+                "general_notes", *VOTE_COLS, "url"]
+        con.executemany(f"INSERT INTO colognes ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", colognes)
+        con.executemany("INSERT INTO cologne_notes (cologne_id, note_id, note_type) VALUES (?, ?, ?)", links)
+    con.close()
+
+# ----- current route: JSON per row -> CSV -> pandas / MultiLabelBinarizer -----
+
+def parse_notes_cell(x) -> list:
+    if not isinstance(x, str):
+        return []
+    s = x.lower().replace("’", "'").replace("`", "'").strip()
+    s = " ".join(s.split())
+    return [t.strip() for t in s.split(",") if t.strip()]
+
+def legacy_matrix(db: Path, csv_path: Path) -> sparse.csr_matrix:
+    from sklearn.preprocessing import MultiLabelBinarizer
+
+    con = sqlite3.connect(str(db))
+    rows = con.execute("SELECT name, brand, launch_year, main_accords, top_notes, middle_notes, base_notes, general_notes, "
+                       "gender_female, gender_more_female, gender_unisex, gender_more_male, gender_male FROM colognes ORDER BY id")
+    with csv_path.open('w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f, delimiter=';')
+        w.writerow(["Perfume", "Brand", "Year", "Top", "Middle", "Base",
+                    "mainaccord1", "mainaccord2", "mainaccord3", "mainaccord4", "mainaccord5", "Votes"])
+        for name, brand, year, acc, top, mid, base, gen, *votes in rows:
+            acc = (json.loads(acc) if acc else [])[:5]
+            mid = (json.loads(mid) if mid else []) + (json.loads(gen) if gen else [])
+            w.writerow([name, brand, year, ", ".join(json.loads(top) if top else []), ", ".join(mid),
+                        ", ".join(json.loads(base) if base else []), *(acc + [''] * (5 - len(acc))),
+                        sum(v or 0 for v in votes)])
+    con.close()
+
+    df = pd.read_csv(csv_path, sep=';')
+    blocks = []
+    for col, level in (("Top", "top"), ("Middle", "mid"), ("Base", "base")):
+        X = MultiLabelBinarizer(sparse_output=True).fit_transform(df[col].apply(parse_notes_cell).tolist())
+        blocks.append(W_NOTE[level] * X.tocsr().astype(np.float32))
+    X_notes = l2_row_normalize_csr(sparse.hstack(blocks).tocsr())
+
+    accord_cols = [f"mainaccord{i + 1}" for i in range(5)]
+    vocab, r_, c_, d_ = {}, [], [], []
+    for i, (_, row) in enumerate(df[accord_cols].iterrows()):
+        for p, col in enumerate(accord_cols):
+            v = row[col]
+            if pd.isna(v) or not str(v).strip():
+                continue
+            j = vocab.setdefault(str(v).strip().lower(), len(vocab))
+            r_.append(i); c_.append(j); d_.append(float(ACCORD_POS_WEIGHTS[p]))
+    X_acc = l2_row_normalize_csr(sparse.csr_matrix((d_, (r_, c_)), shape=(len(df), len(vocab)), dtype=np.float32)) * W_ACCORD
+
+    yr = pd.to_numeric(df['Year'], errors='coerce')   # brand-aware median, as in Data Cleaning.ipynb
+    yr = yr.fillna(df.assign(Year=yr).groupby('Brand')['Year'].transform('median')).fillna(yr.median()).to_numpy(float)
+    M = np.vstack([np.zeros(len(df)), z_score(np.log1p(df['Votes'].to_numpy(float))), z_score(yr)]).T
+    X_meta = l2_row_normalize_csr(sparse.csr_matrix(M)) * W_META
+    return sparse.hstack([X_notes, X_acc, X_meta]).tocsr().astype(np.float32)
+
+def timed(fn, *a, **kw):
+    t0 = time.perf_counter()
+    out = fn(*a, **kw)
+    return out, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=Path, default=None, help='Existing database (a copy is used); default builds one.')
+    ap.add_argument("--touch", type=float, default=0.01, help='Share of rows modified before the incremental export.')
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        db = tmp/'catalog.db'
+        if args.db:
+            from sqlalchemy import create_engine
+            from database.migrations import migrate
+            db.write_bytes(args.db.read_bytes())
+            migrate(create_engine(f"sqlite:///{db}"))   # the copy may predate colognes.updated_at
+        else:
+            build_database(db, args.seed)
+        n = sqlite3.connect(str(db)).execute("SELECT COUNT(*) FROM colognes").fetchone()[0]
+        print(f"{n} colognes")
+
+        X_old, t_old = timed(legacy_matrix, db, tmp/'fra_cleaned.csv')
+        print(f"[json+csv+pandas ] db -> X_sparse {t_old:7.2f}s  shape={X_old.shape} nnz={X_old.nnz}")
+
+        out = tmp/'catalog'
+        res, t_exp = timed(export_catalog, db, out, full=True)
+        (X_new, _), t_feat = timed(catalog_matrix, out)
+        print(f"[parquet (full)   ] export {t_exp:6.2f}s + features {t_feat:6.2f}s = {t_exp + t_feat:7.2f}s  "
+              f"shape={X_new.shape} nnz={X_new.nnz}  ({res['buckets']} buckets)")
+
+        con = sqlite3.connect(str(db))
+        ids = [r[0] for r in con.execute("SELECT id FROM colognes")]
+        touched = random.Random(args.seed).sample(ids, max(1, int(args.touch * len(ids))))
+        with con:
+            con.executemany("UPDATE colognes SET launch_year = launch_year WHERE id = ?", [(i,) for i in touched])
+        con.close()
+        res, t_inc = timed(export_catalog, db, out)
+        _, t_feat = timed(catalog_matrix, out)
+        print(f"[parquet (incr.)  ] {len(touched)} rows touched: export {t_inc:6.2f}s "
+              f"({res['rewritten']}/{res['buckets']} buckets) + features {t_feat:6.2f}s")
+
+        if X_old.shape == X_new.shape:
+            diff = abs(X_old - X_new)
+            print(f"parity: max |X_old - X_new| = {diff.max() if diff.nnz else 0.0:.2e}")
+        else:
+            print(f"parity: shapes differ {X_old.shape} vs {X_new.shape} (note names split on commas by the CSV route)")
+
+if __name__ == '__main__':
+    main()
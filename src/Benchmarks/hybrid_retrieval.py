@@ -0,0 +1,78 @@
+"""
+Dense KNN pool vs. hybrid (inverted index + dense) retrieval: end-to-end latency and how often
+returned items break a hard constraint (avoid_notes, disliked_accords, must_notes).
+
+Queries are the generated personas; a share of them also get a "must contain" note so the
+must-constraint path is exercised.
+
+Usage (from src/Benchmarks):
+    python hybrid_retrieval.py --mode ae --repeat 3
+"""
+import os, sys, json, time, random, argparse, statistics
+from pathlib import Path
+
+MODELLING = Path(__file__).resolve().parent.parent/'Modelling'
+sys.path.insert(0, str(MODELLING))
+os.chdir(MODELLING)  # ART is relative to src/Modelling
+
+from recommender import Recommender
+
+ART = Path('../../data/processed')
+MUST_NOTES = ['oud', 'vanilla', 'bergamot', 'rose', 'musk', 'vetiver']
+
+def load_queries(path: Path, must_share: float, seed: int) -> list:
+    rng = random.Random(seed)
+    queries = []
+    with path.open(encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            p = json.loads(line)
+            if rng.random() < must_share:
+                p['must_notes'] = [rng.choice(MUST_NOTES)]
+            queries.append(p)
+    return queries
+
+def run(rec: Recommender, queries: list, mode: str, retrieval: str, top_k: int, repeat: int) -> dict:
+    fid_row = {str(f): i for i, f in enumerate(rec.bundle.item_col('fragrance_id'))}
+    lat, returned, violating, queries_violating, empty = [], 0, 0, 0, 0
+    for _ in range(repeat):
+        for q in queries:
+            t0 = time.perf_counter()
+            recs = rec.recommend_records(q, mode=mode, retrieval=retrieval, top_k=top_k)
+            lat.append(time.perf_counter() - t0)
+            rows = [fid_row[r['fragrance_id']] for r in recs]
+            v = rec.index.violations(q, rows)
+            returned += len(rows); violating += v
+            queries_violating += v > 0; empty += not rows
+    lat.sort()
+    n = len(queries) * repeat
+    return {
+        "p50_ms": 1000 * statistics.median(lat),
+        "p95_ms": 1000 * lat[int(0.95 * (len(lat) - 1))],
+        "violation_rate": violating / max(1, returned),
+        "queries_with_violation": queries_violating / n,
+        "empty_results": empty / n,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", type=str, default='ae', choices=['ae', 'svd'])
+    ap.add_argument("--top-k", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--must-share", type=float, default=0.3, help='Share of queries with a must-contain note.')
+    ap.add_argument("--personas", type=Path, default=ART/'personas_v3.jsonl')
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    rec = Recommender.load()
+    queries = load_queries(args.personas, args.must_share, args.seed)
+    rec.recommend_records(queries[0], mode=args.mode)  # warm the page cache
+    for retrieval in ('dense', 'hybrid'):
+        r = run(rec, queries, args.mode, retrieval, args.top_k, args.repeat)
+        print(f"[{retrieval:6s}] p50={r['p50_ms']:6.1f}ms p95={r['p95_ms']:6.1f}ms  "
+              f"violating items={r['violation_rate']:6.1%}  queries w/ violation={r['queries_with_violation']:6.1%}  "
+              f"empty={r['empty_results']:5.1%}")
+
+if __name__ == '__main__':
+    main()
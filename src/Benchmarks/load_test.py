@@ -0,0 +1,117 @@
+"""
+Local load test for the recommendation service: QPS and latency vs. worker count.
+
+For each worker count the service is started from src/Modelling, warmed up, and hit by
+--concurrency client threads (keep-alive connections) for --seconds. Preferences are
+sampled from the generated personas so the traffic looks like real taste profiles.
+
+The response cache is off by default: the persona set is small, so nearly every request would
+be a hit and the numbers would no longer measure the recommender. Cache-on numbers come from
+response_cache.py, or pass --cache-mb here.
+
+Usage (from src/Benchmarks):
+    python load_test.py --workers 1 2 4 --concurrency 32 --seconds 15
+"""
+import json, sys, time, random, argparse, subprocess, threading, statistics
+import http.client
+from pathlib import Path
+
+MODELLING = Path(__file__).resolve().parent.parent/'Modelling'
+ART = Path(__file__).resolve().parents[2]/'data'/'processed'
+
+PREF_KEYS = ["liked_accords_ranked", "disliked_accords", "liked_notes_top", "liked_notes_mid",
+             "liked_notes_base", "avoid_notes", "gender_focus", "season", "use_case", "intensity"]
+
+def load_preferences(path: Path) -> list:
+    prefs = []
+    with path.open(encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                p = json.loads(line)
+                prefs.append({k: p[k] for k in PREF_KEYS if k in p})
+    return prefs
+
+def wait_ready(port: int, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/healthz')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"service on :{port} did not become ready")
+
+def client(port: int, prefs: list, mode: str, stop_at: float, lat: list, codes: dict, lock: threading.Lock, seed: int):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    local_lat, local_codes = [], {}
+    while time.time() < stop_at:
+        body = json.dumps({"preference": rng.choice(prefs), "mode": mode, "top_k": 20})
+        t0 = time.perf_counter()
+        try:
+            conn.request('POST', '/recommend', body=body, headers={'content-type': 'application/json'})
+            resp = conn.getresponse(); resp.read()
+            status = resp.status
+        except OSError:
+            conn.close(); conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            status = 0
+        if status == 200:
+            local_lat.append(time.perf_counter() - t0)
+        local_codes[status] = local_codes.get(status, 0) + 1
+    with lock:
+        lat.extend(local_lat)
+        for k, v in local_codes.items():
+            codes[k] = codes.get(k, 0) + v
+
+def run_load(port: int, prefs: list, mode: str, concurrency: int, seconds: float) -> dict:
+    lat, codes, lock = [], {}, threading.Lock()
+    stop_at = time.time() + seconds
+    threads = [threading.Thread(target=client, args=(port, prefs, mode, stop_at, lat, codes, lock, i))
+               for i in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t0
+    lat.sort()
+    return {
+        "qps": len(lat) / elapsed,
+        "p50_ms": 1000 * statistics.median(lat) if lat else None,
+        "p99_ms": 1000 * lat[int(0.99 * (len(lat) - 1))] if lat else None,
+        "status_counts": codes,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4])
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--seconds", type=float, default=15.0)
+    ap.add_argument("--mode", type=str, default='ae', choices=['ae', 'svd'])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--personas", type=Path, default=ART/'personas_v3.jsonl')
+    ap.add_argument("--cache-mb", type=float, default=0, help='Response cache per worker (default 0 = off).')
+    ap.add_argument("--out", type=Path, default=None, help='Optional JSON file for the results.')
+    args = ap.parse_args()
+
+    prefs = load_preferences(args.personas)
+    results = {}
+    for n in args.workers:
+        proc = subprocess.Popen([sys.executable, 'service.py', '--workers', str(n), '--port', str(args.port),
+                                 '--cache-mb', str(args.cache_mb), '--cache-db', ''], cwd=MODELLING)
+        try:
+            wait_ready(args.port)
+            run_load(args.port, prefs, args.mode, args.concurrency, min(3.0, args.seconds))  # warm up
+            res = run_load(args.port, prefs, args.mode, args.concurrency, args.seconds)
+        finally:
+            proc.terminate(); proc.wait(timeout=30)
+        results[n] = res
+        print(f"workers={n:<3d} qps={res['qps']:8.1f}  p50={res['p50_ms'] or 0:7.1f}ms  "
+              f"p99={res['p99_ms'] or 0:7.1f}ms  status={res['status_counts']}")
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Persona validation throughput: the original per-field validate(p, vocab) (copied below from
+before PersonaValidator; rebuilds the vocab sets each call) vs. the compiled
+PersonaValidator.validate_batch, plus the columnar parquet writer vs. pandas.
+
+Raw personas come from the stub LLM generator with some noise mixed in (casing, padding,
+out-of-vocab names), so both paths do real filtering work.
+
+Usage (from src/Benchmarks):
+    python persona_validation.py --n 10000
+"""
+import os, sys, copy, time, random, argparse, tempfile
+from pathlib import Path
+
+MODELLING = Path(__file__).resolve().parent.parent/'Modelling'
+sys.path.insert(0, str(MODELLING))
+os.chdir(MODELLING)  # ART is relative to src/Modelling
+
+import PersonaGenerator as pg
+from stub_llm import fake_persona
+
+# ----- baseline: PersonaGenerator.validate before PersonaValidator -----
+
+def _norm_list(xs):
+    seen, out = set(), []
+    for x in xs or []:
+        s = str(x).strip().lower()
+        if s and s not in seen:
+            seen.add(s); out.append(s)
+    return out
+
+def legacy_validate(p, v):
+    accords = set(v['accords']); top=set(v['top']); mid = set(v['mid']); base = set(v['base'])
+    all_notes = top|mid|base
+
+    p['liked_accords_ranked'] = [{"name": a['name'], "rank": i + 1} for i, a in
+                                 enumerate(list(p.get('liked_accords_ranked', []))) if a['name'] in accords][:5]
+    p['disliked_accords'] = [a for a in list(p.get('disliked_accords', [])) if
+                             a in accords and a not in [item['name'] for item in p['liked_accords_ranked']]][:3]
+    p["liked_notes_top"]  = [n for n in _norm_list(p.get("liked_notes_top", []))  if n in top][:10]
+    p["liked_notes_mid"]  = [n for n in _norm_list(p.get("liked_notes_mid", []))  if n in mid][:10]
+    p["liked_notes_base"] = [n for n in _norm_list(p.get("liked_notes_base", [])) if n in base][:10]
+
+    avoid = [n for n in _norm_list(p.get('avoid_notes',[])) if (n in all_notes
+                                                                and n not in p['liked_notes_top']
+                                                                and n not in p['liked_notes_mid']
+                                                                and n not in p['liked_notes_base'])]
+    p['avoid_notes'] = avoid[:5]
+
+    p['gender_focus'] = (p.get('gender_focus','any')or 'any').lower()
+    if p['gender_focus'] not in pg.GENDER_CHOICES: p['gender_focus']='any'
+    p["season"] = (p.get("season", "all") or "all").lower()
+    if p["season"] not in pg.SEASON_CHOICES: p["season"] = "all"
+    p["use_case"] = (p.get('use_case','casual') or 'casual').lower()
+    if p['use_case'] not in pg.USE_CASE_CHOICES: p['use_case'] = 'casual'
+    p["intensity"] = (p.get("intensity", "moderate") or "moderate").lower()
+    if p["intensity"] not in pg.INTENSITY_CHOICES: p["intensity"] = "moderate"
+
+    if len(p['liked_accords_ranked']) < 3:
+        for a in ['woody', 'citrus', 'aromatic', 'floral', 'amber']:
+            if a in accords and a not in [item['name'] for item in p['liked_accords_ranked']]:
+                current_rank = len(p['liked_accords_ranked']) + 1
+                p['liked_accords_ranked'].append({"name": a, "rank": current_rank})
+            if len(p['liked_accords_ranked']) >= 5: break
+
+    if not (p["liked_notes_top"] or p["liked_notes_mid"] or p["liked_notes_base"]):
+        p["liked_notes_top"]  = list(top)[:5]
+        p["liked_notes_mid"]  = list(mid)[:5]
+        p["liked_notes_base"] = list(base)[:5]
+    return p
+
+def noisy(p: dict, rng: random.Random) -> dict:
+    for k in ("liked_notes_top", "liked_notes_mid", "liked_notes_base", "avoid_notes"):
+        p[k] = [f"  {n.upper()} " if rng.random() < 0.2 else n for n in p[k]] + ["not a note"] * (rng.random() < 0.3)
+    p["liked_accords_ranked"].insert(rng.randint(0, 5), {"name": "not an accord", "rank": 0})
+    p["season"] = p["season"].upper() if rng.random() < 0.2 else p["season"]
+    return p
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=10000)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    _, t_vocab_cold = timed(pg.load_vocab.__wrapped__)   # bypass lru_cache; still hits the on-disk cache
+    v = pg.load_vocab()
+    rng = random.Random(args.seed)
+    raw = [noisy(fake_persona(rng, v), rng) for _ in range(args.n)]
+
+    legacy_in, batch_in = copy.deepcopy(raw), copy.deepcopy(raw)
+    legacy, t_legacy = timed(lambda ps: [legacy_validate(p, v) for p in ps], legacy_in)
+    validator, t_compile = timed(pg.PersonaValidator, v)
+    batch, t_batch = timed(validator.validate_batch, batch_in)
+    assert len(batch) == len(legacy)
+
+    print(f"load_vocab:            {t_vocab_cold*1000:8.1f} ms")
+    print(f"validate (original):   {args.n / t_legacy:12,.0f} personas/s")
+    print(f"validator compile:     {t_compile*1000:8.1f} ms")
+    print(f"validate_batch:        {args.n / t_batch:12,.0f} personas/s  ({t_legacy / t_batch:.1f}x)")
+
+    import pandas as pd
+    with tempfile.TemporaryDirectory() as tmp:
+        pg.ART = Path(tmp)
+        _, t_pandas = timed(lambda: pd.DataFrame(batch).to_parquet(Path(tmp)/'pandas.parquet', index=False))
+        _, t_save = timed(pg.save, batch, 'bench')
+    print(f"pandas to_parquet:     {args.n / t_pandas:12,.0f} personas/s")
+    print(f"save (arrow + jsonl):  {args.n / t_save:12,.0f} personas/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Response cache benchmark: replays a Zipf-skewed stream of persona queries (a few popular
+profiles, a long tail) against recommend_records() without a cache, with the in-process tier,
+and with the in-process + SQLite tiers; then fires concurrent identical misses to check that
+single-flight computes each key once.
+
+Usage (from src/Benchmarks):
+    python response_cache.py --requests 5000 --zipf 1.1 --memory-mb 8
+"""
+import os, sys, json, time, random, argparse, tempfile, statistics
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+MODELLING = Path(__file__).resolve().parent.parent/'Modelling'
+sys.path.insert(0, str(MODELLING))
+os.chdir(MODELLING)  # ART is relative to src/Modelling
+
+from recommender import Recommender
+from result_cache import ResultCache
+
+ART = Path('../../data/processed')
+
+def load_personas(path: Path) -> list:
+    with path.open(encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def zipf_stream(n_items: int, n: int, s: float, seed: int) -> list:
+    rng = random.Random(seed)
+    weights = [1.0 / (r + 1) ** s for r in range(n_items)]
+    return rng.choices(range(n_items), weights=weights, k=n)
+
+def replay(rec: Recommender, personas: list, stream: list, mode: str) -> dict:
+    lat = []
+    for i in stream:
+        t0 = time.perf_counter()
+        rec.recommend_records(personas[i], mode=mode)
+        lat.append(time.perf_counter() - t0)
+    lat.sort()
+    return {
+        "mean_ms": 1000 * statistics.fmean(lat),
+        "p50_ms": 1000 * statistics.median(lat),
+        "p95_ms": 1000 * lat[int(0.95 * (len(lat) - 1))],
+    }
+
+def stampede(rec: Recommender, persona: dict, mode: str, threads: int) -> int:
+    """Concurrent identical misses; returns how many times the pipeline actually ran."""
+    ran = [0]
+    compute = rec._recommend_records
+    def counted(*a, **kw):
+        ran[0] += 1
+        return compute(*a, **kw)
+    rec._recommend_records = counted
+    try:
+        with ThreadPoolExecutor(threads) as ex:
+            list(ex.map(lambda _: rec.recommend_records(persona, mode=mode), range(threads)))
+    finally:
+        del rec._recommend_records
+    return ran[0]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", type=str, default='ae', choices=['ae', 'svd'])
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--zipf", type=float, default=1.1, help='Skew of the query popularity distribution.')
+    ap.add_argument("--memory-mb", type=float, default=8)
+    ap.add_argument("--disk-mb", type=float, default=64)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--personas", type=Path, default=ART/'personas_v3.jsonl')
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    rec = Recommender.load()
+    personas = load_personas(args.personas)
+    stream = zipf_stream(len(personas), args.requests, args.zipf, args.seed)
+    print(f"{args.requests} requests over {len(set(stream))} distinct profiles (zipf s={args.zipf})")
+    rec.recommend_records(personas[0], mode=args.mode)  # warm the page cache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tiers = {
+            "no cache": None,
+            "memory": ResultCache(int(args.memory_mb * (1 << 20))),
+            "memory+sqlite": ResultCache(int(args.memory_mb * (1 << 20)), Path(tmp)/'cache.sqlite',
+                                         int(args.disk_mb * (1 << 20))),
+        }
+        for name, cache in tiers.items():
+            rec.cache = cache
+            r = replay(rec, personas, stream, args.mode)
+            line = f"[{name:13s}] mean={r['mean_ms']:6.2f}ms p50={r['p50_ms']:6.2f}ms p95={r['p95_ms']:6.2f}ms"
+            if cache is not None:
+                st = cache.stats()
+                line += f"  hit rate={st['hit_rate']:6.1%} (memory {st['memory_hits']}, disk {st['disk_hits']})" \
+                        f"  memory evictions={st['memory_evictions']}"
+            print(line)
+
+        # a second process would start with a cold memory tier but a warm SQLite file
+        shared = ResultCache(int(args.memory_mb * (1 << 20)), Path(tmp)/'cache.sqlite', int(args.disk_mb * (1 << 20)))
+        rec.cache = shared
+        r = replay(rec, personas, stream, args.mode)
+        st = shared.stats()
+        print(f"[{'new worker':13s}] mean={r['mean_ms']:6.2f}ms p50={r['p50_ms']:6.2f}ms p95={r['p95_ms']:6.2f}ms"
+              f"  hit rate={st['hit_rate']:6.1%} (disk {st['disk_hits']})")
+
+        rec.cache = ResultCache()
+        ran = stampede(rec, personas[-1], args.mode, args.threads)
+        print(f"[stampede     ] {args.threads} concurrent identical misses -> pipeline ran {ran}x "
+              f"(coalesced {rec.cache.stats()['coalesced']})")
+        for cache in tiers.values():
+            if cache is not None:
+                cache.close()
+        shared.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+SVD refit benchmark: TruncatedSVD (the notebook's fit) vs. the streaming randomized SVD in
+streaming_svd.py, cold and warm-started, on X_sparse.npz and on a synthetic catalog N× larger.
+
+Every fit runs in a fresh interpreter. Wall time covers fit + catalog embeddings; peak memory is
+the rise of the process high-water mark over the loaded matrix. Quality is the explained
+variance and the subspace cosine to the TruncatedSVD components.
+
+Usage (from src/Benchmarks):
+    python svd_refit.py --scale 1 10 --threads 8
+"""
+import sys, json, argparse, tempfile, subprocess
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+MODELLING = Path(__file__).resolve().parent.parent/'Modelling'
+ART = MODELLING/'../../data/processed'
+
+# argv: method, X path, n_components, threads, block_rows, init path ('' = none), components out path
+CHILD = """
+import sys, json, time, resource
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+from streaming_svd import fit, embed, iter_blocks
+
+def rss_mb(field):
+    try:
+        for line in open('/proc/self/status'):
+            if line.startswith(field):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+method, path, k, threads, block_rows, init, out = sys.argv[1:]
+k, threads, block_rows = int(k), int(threads), int(block_rows)
+X = sparse.load_npz(path).tocsr()
+init = np.load(init) if init else None
+try:
+    open('/proc/self/clear_refs', 'w').write('5')   # reset the high-water mark after loading
+except OSError:
+    pass
+base = rss_mb('VmRSS')
+
+t0 = time.perf_counter()
+if method == 'truncated':
+    svd = TruncatedSVD(n_components=k, random_state=42)
+    svd.fit_transform(X)
+    C, evr, passes = svd.components_, float(svd.explained_variance_ratio_.sum()), None
+else:
+    res = fit(lambda: iter_blocks(X, block_rows), X.shape[1], n_components=k, init=init, threads=threads)
+    embed(iter_blocks(X, block_rows), res['components'], X.shape[0], threads=threads)
+    C, evr, passes = res['components'], float(res['explained_variance_ratio'].sum()), res['n_passes']
+elapsed = time.perf_counter() - t0
+
+np.save(out, np.asarray(C, dtype=np.float32))
+print(json.dumps({"time_s": elapsed, "peak_mb": rss_mb('VmHWM') - base, "evr": evr, "passes": passes}))
+"""
+
+def synthetic_catalog(X: sparse.csr_matrix, scale: int, seed: int = 42) -> sparse.csr_matrix:
+    """scale× the rows: copies of X with ~15% of entries dropped and log-normal value noise."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for _ in range(scale):
+        P = X.copy().astype(np.float32)
+        P.data *= rng.lognormal(0.0, 0.2, P.data.size).astype(np.float32)
+        P.data[rng.random(P.data.size) < 0.15] = 0.0
+        P.eliminate_zeros()
+        parts.append(P)
+    return sparse.vstack(parts).tocsr()
+
+def run(method: str, x_path: Path, k: int, threads: int, block_rows: int, init: str, out: Path) -> dict:
+    r = subprocess.run([sys.executable, '-c', CHILD, method, str(x_path), str(k), str(threads),
+                        str(block_rows), init, str(out)],
+                       cwd=MODELLING, capture_output=True, text=True, check=True)
+    return json.loads(r.stdout.strip().splitlines()[-1])
+
+def subspace_cos(A: np.ndarray, B: np.ndarray) -> float:
+    return float(np.clip(np.linalg.svd(A.astype(np.float64) @ B.T.astype(np.float64), compute_uv=False), 0, 1).mean())
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, nargs='+', default=[1, 10], help='Catalog sizes as multiples of X_sparse.')
+    ap.add_argument("--components", type=int, default=256)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--block-rows", type=int, default=4096)
+    args = ap.parse_args()
+
+    X = sparse.load_npz(ART/'X_sparse.npz').tocsr()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for scale in args.scale:
+            x_path = tmp/f'X_{scale}.npz'
+            Xs = X if scale == 1 else synthetic_catalog(X, scale)
+            sparse.save_npz(x_path, Xs, compressed=False)
+            print(f"== {scale}x catalog: {Xs.shape[0]} items x {Xs.shape[1]} features, nnz={Xs.nnz}")
+            del Xs
+
+            ref = tmp/f'C_truncated_{scale}.npy'
+            rows = [('truncated', run('truncated', x_path, args.components, args.threads, args.block_rows, '', ref))]
+            # warm start from the reference components stands in for the previous svd_pipe.joblib
+            for method, init in (('streaming', ''), ('streaming-warm', str(ref))):
+                out = tmp/f'C_{method}_{scale}.npy'
+                r = run(method, x_path, args.components, args.threads, args.block_rows, init, out)
+                r['subspace_cos'] = subspace_cos(np.load(ref), np.load(out))
+                rows.append((method, r))
+
+            for method, r in rows:
+                line = f"[{method:14s}] time={r['time_s']:7.2f}s peak=+{r['peak_mb']:7.1f}MB explained var={r['evr']:.4f}"
+                if r.get('passes'):
+                    line += f" passes={r['passes']} subspace cos vs truncated={r['subspace_cos']:.4f}"
+                print(line)
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,29 @@
 """
 Generate synthetic user preference personas tailored to your fragrance dataset.
 
+Batches are requested concurrently (bounded by --concurrency) with retry + backoff. Each batch
+prompt carries a random sample of the note vocab instead of the full lists, which keeps prompts
+small; validation still runs against the full vocab. Validated personas are appended to a
+checkpoint JSONL as batches complete, so a crashed run resumes where it stopped, and personas
+whose build_query vectors are near-duplicates (cosine >= --dedup) of an earlier one are dropped.
+
+Point --base-url at stub_llm.py to run the pipeline without an API key.
+
 Outputs:
 - data/processed/personas.parquet  (table)
-- data/processed/personas.jsonl    (raw line-delimited JSON for inspection)"""
-import os, json, math, time, argparse
+- data/processed/personas.jsonl    (raw line-delimited JSON for inspection)
+- data/processed/personas.partial.jsonl  (append-only checkpoint while generating: personas + spent batch seeds)"""
+import os, sys, json, math, random, asyncio, argparse
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from dotenv import load_dotenv
 
-import pandas as pd
+import numpy as np
+from scipy import sparse
 
-from openai import OpenAI
+from bundle import feature_positions
+from recommender import build_query
 
 load_dotenv()
 
@@ -23,21 +35,48 @@ SEASON_CHOICES = ['spring','summer','fall','winter','all']
 USE_CASE_CHOICES = ['office','date','gym','casual','formal','signature']
 INTENSITY_CHOICES = ['soft','moderate','loud']
 
-def load_vocab() -> Dict[str, List[str]]:
-    meta = json.loads((ART/'feature_meta.json').read_text())
-    # use full vocab without downsampling
-    return {
-        "feature_meta": meta,
+VOCAB_CACHE = ART/'persona_vocab.json'
+SEED_KEY = '_next_batch_seed'   # checkpoint lines with this key mark spent batch seeds, not personas
+META_KEYS = ["top_mlb_classes", "mid_mlb_classes", "base_mlb_classes", "accord_vocab", "feature_names"]
+
+@lru_cache(maxsize=1)
+def load_vocab() -> Dict[str, Any]:
+    """
+    Persona vocab (full, no downsampling) plus the slice of feature_meta that build_query needs.
+    The result is cached next to feature_meta.json, keyed on its mtime/size, so later runs skip
+    parsing the 4 MB file (most of it is row_index).
+    """
+    src = ART/'feature_meta.json'
+    st = src.stat()
+    key = [st.st_mtime_ns, st.st_size]
+    if VOCAB_CACHE.exists():
+        cached = json.loads(VOCAB_CACHE.read_text())
+        if cached.get('source') == key:
+            return cached['vocab']
+
+    meta = json.loads(src.read_text())
+    vocab = {
+        "feature_meta": {k: meta[k] for k in META_KEYS},
         "accords": list(dict.fromkeys([s.strip().lower() for s in meta["accord_vocab"]])),
         "top":     list(dict.fromkeys([s.strip().lower() for s in meta["top_mlb_classes"]])),
         "mid":     list(dict.fromkeys([s.strip().lower() for s in meta["mid_mlb_classes"]])),
         "base":    list(dict.fromkeys([s.strip().lower() for s in meta["base_mlb_classes"]])),
     }
+    VOCAB_CACHE.write_text(json.dumps({'source': key, 'vocab': vocab}))
+    return vocab
+
+def sample_vocab(v: Dict[str, List[str]], rng: random.Random, k_notes: int = 150) -> Dict[str, List[str]]:
+    """Per-batch prompt vocab: all accords (small), a random k_notes-sized subset of each note level."""
+    out = {"accords": v["accords"]}
+    for level in ("top", "mid", "base"):
+        notes = v[level]
+        out[level] = notes if not k_notes or len(notes) <= k_notes else sorted(rng.sample(notes, k_notes))
+    return out
 
 def make_persona_prompt(n_personas: int, vocab: Dict[str, List[str]]) -> str:
     """Strict, short prompt that forces choices from your vocab only."""
     return f"""
-Return ONLY valid JSON: an array of {n_personas} persona objects.
+Return ONLY valid JSON: an object {{"personas": [...]}} holding an array of {n_personas} persona objects.
 Each persona strictly follows this schema (all strings lowercase):
 
 {{
@@ -84,49 +123,92 @@ def _norm_list(xs):
             seen.add(s); out.append(s)
     return out
 
+def _choice(x, choices: frozenset, default: str) -> str:
+    s = (x or default)
+    s = s.lower() if isinstance(s, str) else default
+    return s if s in choices else default
+
+class PersonaValidator:
+    """
+    Validator compiled once per vocab: interned frozensets for membership and the fallback
+    lists are built here instead of on every persona. validate_batch() runs a whole LLM
+    response (or a 10k-persona file) through one call.
+    """
+    FALLBACK_ACCORDS = ['woody', 'citrus', 'aromatic', 'floral', 'amber']
+
+    def __init__(self, v: Dict[str, List[str]]):
+        intern = sys.intern
+        self.accords = frozenset(intern(a) for a in v['accords'])
+        self.top = frozenset(intern(n) for n in v['top'])
+        self.mid = frozenset(intern(n) for n in v['mid'])
+        self.base = frozenset(intern(n) for n in v['base'])
+        self.all_notes = self.top | self.mid | self.base
+        self.fallback_accords = [a for a in self.FALLBACK_ACCORDS if a in self.accords]
+        self.fallback_notes = {level: list(v[level])[:5] for level in ('top', 'mid', 'base')}
+        self.genders = frozenset(GENDER_CHOICES)
+        self.seasons = frozenset(SEASON_CHOICES)
+        self.use_cases = frozenset(USE_CASE_CHOICES)
+        self.intensities = frozenset(INTENSITY_CHOICES)
+
+    def validate(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        accords = self.accords
+        # rank keeps the position in the model's list, as before
+        p['liked_accords_ranked'] = [{"name": a['name'], "rank": i + 1} for i, a in
+                                     enumerate(list(p.get('liked_accords_ranked', None) or []))
+                                     if isinstance(a, dict) and a.get('name') in accords][:5]
+        liked_set = {a['name'] for a in p['liked_accords_ranked']}
+        p['disliked_accords'] = [a for a in list(p.get('disliked_accords', None) or [])
+                                 if a in accords and a not in liked_set][:3]
+
+        top = [n for n in _norm_list(p.get("liked_notes_top", None))  if n in self.top][:10]
+        mid = [n for n in _norm_list(p.get("liked_notes_mid", None))  if n in self.mid][:10]
+        base = [n for n in _norm_list(p.get("liked_notes_base", None)) if n in self.base][:10]
+        p["liked_notes_top"], p["liked_notes_mid"], p["liked_notes_base"] = top, mid, base
+
+        liked_notes = set(top); liked_notes.update(mid); liked_notes.update(base)
+        p['avoid_notes'] = [n for n in _norm_list(p.get('avoid_notes', None))
+                            if n in self.all_notes and n not in liked_notes][:5]
+
+        p['gender_focus'] = _choice(p.get('gender_focus'), self.genders, 'any')
+        p['season'] = _choice(p.get('season'), self.seasons, 'all')
+        p['use_case'] = _choice(p.get('use_case'), self.use_cases, 'casual')
+        p['intensity'] = _choice(p.get('intensity'), self.intensities, 'moderate')
+
+        ranked = p['liked_accords_ranked']
+        if len(ranked) < 3:
+            for a in self.fallback_accords:
+                if a not in liked_set:
+                    ranked.append({"name": a, "rank": len(ranked) + 1})
+                    liked_set.add(a)
+                if len(ranked) >= 5: break
+
+        if not (top or mid or base):
+            p["liked_notes_top"] = list(self.fallback_notes['top'])
+            p["liked_notes_mid"] = list(self.fallback_notes['mid'])
+            p["liked_notes_base"] = list(self.fallback_notes['base'])
+        return p
+
+    def validate_batch(self, personas: List[Any]) -> List[Dict[str, Any]]:
+        """Validates personas in place; non-dict entries (malformed LLM output) are dropped."""
+        validate = self.validate
+        return [validate(p) for p in personas if isinstance(p, dict)]
+
+@lru_cache(maxsize=1)
+def load_validator() -> PersonaValidator:
+    return PersonaValidator(load_vocab())
+
 def validate(p: Dict[str, Any], v: Dict[str,List[str]]) -> Dict[str,Any]:
-    accords = set(v['accords']); top=set(v['top']); mid = set(v['mid']); base = set(v['base'])
-    all_notes = top|mid|base
-
-    p['liked_accords_ranked'] = [{"name": a['name'], "rank": i + 1} for i, a in
-                                 enumerate(list(p.get('liked_accords_ranked', []))) if a['name'] in accords][:5]
-    p['disliked_accords'] = [a for a in list(p.get('disliked_accords', [])) if
-                             a in accords and a not in [item['name'] for item in p['liked_accords_ranked']]][:3]
-    p["liked_notes_top"]  = [n for n in _norm_list(p.get("liked_notes_top", []))  if n in top][:10]
-    p["liked_notes_mid"]  = [n for n in _norm_list(p.get("liked_notes_mid", []))  if n in mid][:10]
-    p["liked_notes_base"] = [n for n in _norm_list(p.get("liked_notes_base", [])) if n in base][:10]
-
-    avoid = [n for n in _norm_list(p.get('avoid_notes',[])) if (n in all_notes
-                                                                and n not in p['liked_notes_top']
-                                                                and n not in p['liked_notes_mid']
-                                                                and n not in p['liked_notes_base'])]
-    p['avoid_notes'] = avoid[:5]
-
-    p['gender_focus'] = (p.get('gender_focus','any')or 'any').lower()
-    if p['gender_focus'] not in GENDER_CHOICES: p['gender_focus']='any'
-    p["season"] = (p.get("season", "all") or "all").lower()
-    if p["season"] not in SEASON_CHOICES: p["season"] = "all"
-    p["use_case"] = (p.get('use_case','casual') or 'casual').lower()
-    if p['use_case'] not in USE_CASE_CHOICES: p['use_case'] = 'casual'
-    p["intensity"] = (p.get("intensity", "moderate") or "moderate").lower()
-    if p["intensity"] not in INTENSITY_CHOICES: p["intensity"] = "moderate"
-
-    if len(p['liked_accords_ranked']) < 3:
-        for a in ['woody', 'citrus', 'aromatic', 'floral', 'amber']:
-            if a in accords and a not in [item['name'] for item in p['liked_accords_ranked']]:
-                current_rank = len(p['liked_accords_ranked']) + 1
-                p['liked_accords_ranked'].append({"name": a, "rank": current_rank})
-            if len(p['liked_accords_ranked']) >= 5: break
-
-    if not (p["liked_notes_top"] or p["liked_notes_mid"] or p["liked_notes_base"]):
-        p["liked_notes_top"]  = list(top)[:5]
-        p["liked_notes_mid"]  = list(mid)[:5]
-        p["liked_notes_base"] = list(base)[:5]
-    return p
-
-def ask_openai(n_personas: int, prompt:str, model='gpt-4o-mini',temperature=0.4) -> List[Dict[str, Any]]:
-    client = OpenAI(api_key=API_KEY)
-    resp = client.chat.completions.create(
+    """Single-persona validation against an arbitrary vocab. Prefer load_validator().validate_batch()."""
+    return PersonaValidator(v).validate(p)
+
+def make_client(base_url: str = None):
+    from openai import AsyncOpenAI
+    # a local stub doesn't check the key, but the client insists on having one;
+    # retries are handled by ask_with_retry, so the client's own retry loop is off
+    return AsyncOpenAI(api_key=API_KEY or ('stub' if base_url else None), base_url=base_url, max_retries=0)
+
+async def ask_openai(client, prompt: str, model='gpt-4o-mini', temperature=0.4) -> List[Dict[str, Any]]:
+    resp = await client.chat.completions.create(
         model=model, messages=[{'role':'user','content':prompt}],
         temperature=temperature, response_format={'type':'json_object'}
     )
@@ -136,25 +218,166 @@ def ask_openai(n_personas: int, prompt:str, model='gpt-4o-mini',temperature=0.4)
             if isinstance(v,list): return v
     raise ValueError("Invalid JSON structure in model response.")
 
-def generate(n_total=100, batch_size=25, sleep_s=0.5,model='gpt-4o-mini',temperature=0.4):
+async def ask_with_retry(client, prompt: str, retries: int = 4, backoff_s: float = 1.0, **kwargs) -> List[Dict[str, Any]]:
+    """ask_openai with exponential backoff + jitter. Re-raises the last error once retries are exhausted."""
+    for attempt in range(retries + 1):
+        try:
+            return await ask_openai(client, prompt, **kwargs)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff_s * 2 ** attempt * (0.5 + random.random())
+            print(f"[!] batch failed ({type(e).__name__}: {e}); retry {attempt + 1}/{retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+class PersonaDeduper:
+    """
+    Greedy near-duplicate filter on build_query vectors: a persona is kept only if its cosine
+    similarity to every previously kept persona is below `threshold`.
+    """
+    def __init__(self, feature_meta: Dict[str, Any], threshold: float = 0.95):
+        self.note_pos, self.accord_pos = feature_positions(feature_meta)
+        self.D = len(feature_meta['feature_names'])
+        self.threshold = threshold
+        self.kept = sparse.csr_matrix((0, self.D), dtype=np.float32)
+
+    def _vectors(self, personas: List[Dict[str, Any]]) -> sparse.csr_matrix:
+        rows, cols, vals = [], [], []
+        for i, p in enumerate(personas):
+            c, v = build_query(p, self.note_pos, self.accord_pos)
+            rows.extend([i] * len(c)); cols.extend(c); vals.extend(v)
+        V = sparse.csr_matrix((vals, (rows, cols)), shape=(len(personas), self.D), dtype=np.float32)
+        n = np.sqrt(V.multiply(V).sum(axis=1)).A1
+        n[n == 0] = 1.0
+        return sparse.csr_matrix(V.multiply(1.0 / n[:, None]))
+
+    def filter(self, personas: List[Dict[str, Any]], limit: int = None) -> List[Dict[str, Any]]:
+        """Returns (at most `limit` of) the personas that are not near-duplicates, and remembers them."""
+        if not personas or (limit is not None and limit <= 0):
+            return []
+        V = self._vectors(personas)
+        max_sim = (V @ self.kept.T).toarray().max(axis=1) if self.kept.shape[0] else np.full(V.shape[0], -np.inf)
+        S = (V @ V.T).toarray()
+        keep = []
+        for i in range(V.shape[0]):
+            if limit is not None and len(keep) >= limit:
+                break
+            if max_sim[i] >= self.threshold:
+                continue
+            keep.append(i)
+            # later personas in this batch must also differ from this one
+            np.maximum(max_sim, S[i], out=max_sim)
+        self.kept = sparse.vstack([self.kept, V[keep]]).tocsr()
+        return [personas[i] for i in keep]
+
+def read_checkpoint(path: Path) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Reads an append-only persona checkpoint. Returns (personas, next batch seed); a torn last
+    line from a crash is ignored.
+    """
+    out, next_seed = [], 0
+    if not path.exists():
+        return out, next_seed
+    with path.open(encoding='utf-8') as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break
+            if isinstance(rec, dict) and SEED_KEY in rec:
+                next_seed = max(next_seed, int(rec[SEED_KEY]))
+            else:
+                out.append(rec)
+    return out, next_seed
+
+def _append_lines(path: Path, records: List[Dict[str, Any]]):
+    with path.open('a', encoding='utf-8') as f:
+        f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+        f.flush(); os.fsync(f.fileno())
+
+def append_checkpoint(path: Path, personas: List[Dict[str, Any]]):
+    if personas:
+        _append_lines(path, personas)
+
+def append_seed_mark(path: Path, next_seed: int):
+    """Records that batch seeds below next_seed are spent, whether or not their personas were kept."""
+    _append_lines(path, [{SEED_KEY: next_seed}])
+
+async def agenerate(n_total=100, batch_size=25, model='gpt-4o-mini', temperature=0.4,
+                    concurrency=4, retries=4, sample_notes=150, dedup=0.95, seed=42,
+                    checkpoint: Path = None, base_url: str = None, max_rounds=5) -> List[Dict[str, Any]]:
     v = load_vocab()
-    out = []
-    n_batches = math.ceil(n_total/batch_size)
-    for b in range(n_batches):
-        n_this = batch_size if b < n_batches-1 else n_total-batch_size*(n_batches-1)
-        prompt = make_persona_prompt(n_this,v)
-        raw = ask_openai(n_this,prompt,model=model,temperature=temperature)
-        out.extend(validate(p,v) for p in raw)
-        time.sleep(sleep_s)
+    validator = load_validator()
+    deduper = PersonaDeduper(v['feature_meta'], threshold=dedup)
+    saved, seed_offset = read_checkpoint(checkpoint) if checkpoint else ([], 0)
+    out = deduper.filter(saved)
+    if out or seed_offset:
+        print(f"[+] Resuming from {checkpoint}: {len(out)} personas, next batch seed {seed_offset}")
+
+    client = make_client(base_url)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run_batch(batch_seed: int, n_this: int):
+        # seeded per batch so a rerun asks for the same vocab slices
+        rng = random.Random(f"{seed}:{batch_seed}")
+        prompt = make_persona_prompt(n_this, sample_vocab(v, rng, sample_notes))
+        async with sem:
+            raw = await ask_with_retry(client, prompt, retries=retries, model=model, temperature=temperature)
+        return validator.validate_batch(raw)
+
+    # duplicates and failed batches leave gaps, so top up over a few rounds; each round's seeds are
+    # marked spent before it runs, so a resumed run never repeats a batch that was dropped or deduped
+    for _ in range(max_rounds):
+        missing = n_total - len(out)
+        if missing <= 0:
+            break
+        n_batches = math.ceil(missing / batch_size)
+        sizes = [min(batch_size, missing - b * batch_size) for b in range(n_batches)]
+        tasks = [asyncio.ensure_future(run_batch(seed_offset + b, n)) for b, n in enumerate(sizes)]
+        seed_offset += n_batches
+        if checkpoint:
+            append_seed_mark(checkpoint, seed_offset)
+        for fut in asyncio.as_completed(tasks):
+            try:
+                personas = await fut
+            except Exception as e:
+                print(f"[!] batch dropped after {retries} retries: {e}")
+                continue
+            kept = deduper.filter(personas, limit=n_total - len(out))
+            if checkpoint:
+                append_checkpoint(checkpoint, kept)
+            out.extend(kept)
+            print(f"[+] {len(out)}/{n_total} personas (kept {len(kept)}/{len(personas)} from batch)")
     return out[:n_total]
 
+def generate(n_total=100, batch_size=25, model='gpt-4o-mini', temperature=0.4, **kwargs) -> List[Dict[str, Any]]:
+    return asyncio.run(agenerate(n_total=n_total, batch_size=batch_size, model=model, temperature=temperature, **kwargs))
+
+def persona_schema():
+    import pyarrow as pa
+    strings = pa.list_(pa.string())
+    return pa.schema([
+        ("liked_accords_ranked", pa.list_(pa.struct([("name", pa.string()), ("rank", pa.int64())]))),
+        ("disliked_accords", strings),
+        ("liked_notes_top", strings),
+        ("liked_notes_mid", strings),
+        ("liked_notes_base", strings),
+        ("avoid_notes", strings),
+        ("gender_focus", pa.string()),
+        ("season", pa.string()),
+        ("use_case", pa.string()),
+        ("intensity", pa.string()),
+    ])
+
 def save(personas: List[Dict[str,Any]],prefix='personas'):
+    """Writes personas column by column into an Arrow table (parquet) and as JSONL in one write."""
+    import pyarrow as pa, pyarrow.parquet as pq
     ART.mkdir(parents=True,exist_ok=True)
-    pd.DataFrame(personas).to_parquet(ART/f"{prefix}.parquet",index=False)
-    with (ART/f'{prefix}.jsonl').open("w",encoding='utf-8') as f:
-        for p in personas:
-            f.write(json.dumps(p,ensure_ascii=False) + '\n')
-    print(f"Saved -> {ART/f'{prefix}.parquet'} and {ART/f"{prefix}.jsonl"}")
+    schema = persona_schema()
+    table = pa.Table.from_pydict({f.name: [p.get(f.name) for p in personas] for f in schema}, schema=schema)
+    pq.write_table(table, ART/f"{prefix}.parquet")
+    (ART/f'{prefix}.jsonl').write_text(''.join(json.dumps(p,ensure_ascii=False) + '\n' for p in personas), encoding='utf-8')
+    print(f"Saved -> {ART/f'{prefix}.parquet'} and {ART/f'{prefix}.jsonl'}")
 
 def main():
     ap = argparse.ArgumentParser()
@@ -163,16 +386,28 @@ def main():
     ap.add_argument("--model",type=str,default='gpt-4o-mini')
     ap.add_argument("--temp",type=float,default=0.4)
     ap.add_argument("--prefix",type=str,default='personas_fullmeta')
+    ap.add_argument("--concurrency",type=int,default=4,help='Max API calls in flight.')
+    ap.add_argument("--retries",type=int,default=4,help='Retries per batch before it is dropped.')
+    ap.add_argument("--sample-notes",type=int,default=150,help='Notes per level shown in each prompt (0 = full vocab).')
+    ap.add_argument("--dedup",type=float,default=0.95,help='Cosine threshold for near-duplicate personas.')
+    ap.add_argument("--seed",type=int,default=42)
+    ap.add_argument("--fresh",action='store_true',help='Ignore an existing checkpoint instead of resuming.')
+    ap.add_argument("--base-url",type=str,default=os.getenv("OPENAI_BASE_URL"),help='OpenAI-compatible endpoint, e.g. stub_llm.py.')
     args = ap.parse_args()
 
-    if not API_KEY:
+    if not API_KEY and not args.base_url:
         raise SystemExit("Please set OPENAI_API_KEY")
 
-    personas = generate(n_total=args.n, batch_size=args.batch, model=args.model,temperature=args.temp)
+    checkpoint = ART/f'{args.prefix}.partial.jsonl'
+    ART.mkdir(parents=True,exist_ok=True)
+    if args.fresh and checkpoint.exists():
+        checkpoint.unlink()
+
+    personas = generate(n_total=args.n, batch_size=args.batch, model=args.model, temperature=args.temp,
+                        concurrency=args.concurrency, retries=args.retries, sample_notes=args.sample_notes,
+                        dedup=args.dedup, seed=args.seed, checkpoint=checkpoint, base_url=args.base_url)
     print(f"Generated personas: {len(personas)}")
     save(personas,prefix=args.prefix)
 
 if __name__ == '__main__':
     main()
-
-
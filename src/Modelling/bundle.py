@@ -0,0 +1,208 @@
+"""
+bundle.py
+---------
+Compiles the modelling artifacts into a pickle-free serving bundle and loads it back.
+
+The bundle is a directory of plain .npy arrays (memory-mappable) plus a small
+index.json. Building it needs joblib/torch/pandas to read the training outputs,
+but loading it only needs numpy, so a new worker starts in well under a second.
+
+Outputs (data/processed/serving/):
+- index.json                      (vocab positions, item schema, cfg, artifact version)
+- Z_ae.npy / Z_svd.npy            (catalog embeddings, L2-normalized rows)
+- ZP_ae.npy / ZP_svd.npy          (persona embeddings)
+- A_item_persona_{ae,svd}.npy     (item x persona affinities)
+- svd_components_t.npy            (D x d, replaces svd_pipe.joblib for query encoding)
+- ae_w1t.npy, ae_b1.npy, ae_w2.npy, ae_b2.npy  (AE encoder, replaces ae.pt)
+- item_*.npy                      (items.parquet columns, accord ids, sample notes)
+- inv_indptr.npy, inv_items.npy, inv_weights.npy  (inverted index over X_sparse, see inverted_index.py)
+"""
+from __future__ import annotations
+import json, hashlib, shutil, argparse
+from pathlib import Path
+from typing import Dict, List, Any
+
+import numpy as np
+
+ART = Path('../../data/processed')
+BUNDLE_DIR = ART/'serving'
+BUNDLE_FORMAT = 3
+
+ITEM_STR_COLS = ["fragrance_id", "Brand", "Perfume", "Gender", "url",
+                 "mainaccord1", "mainaccord2", "mainaccord3", "mainaccord4", "mainaccord5"]
+ITEM_NUM_COLS = ["Year", "Weighted Rating", "Rating Count"]
+SAMPLE_NOTES_PER_LEVEL = 3
+
+def _file_key(col: str) -> str:
+    return 'item_' + col.lower().replace(' ', '_')
+
+def _norm(s: Any) -> str:
+    return str(s).strip().lower()
+
+def _str_array(values) -> np.ndarray:
+    # fixed-width unicode keeps the array loadable with allow_pickle=False
+    return np.array(['' if v is None or (isinstance(v, float) and np.isnan(v)) else str(v) for v in values], dtype=str)
+
+def _svd_components(art: Path) -> np.ndarray:
+    from joblib import load
+    svd_pipe = load(art/'svd_pipe.joblib')
+    svd = svd_pipe.steps[0][1]
+    return np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+def _ae_encoder(art: Path) -> Dict[str, np.ndarray]:
+    import torch
+    sd = torch.load(art/'ae.pt', map_location='cpu')
+    return {
+        'ae_w1t': np.ascontiguousarray(sd['enc.0.weight'].numpy().T, dtype=np.float32),
+        'ae_b1': sd['enc.0.bias'].numpy().astype(np.float32),
+        'ae_w2': np.ascontiguousarray(sd['enc.2.weight'].numpy(), dtype=np.float32),
+        'ae_b2': sd['enc.2.bias'].numpy().astype(np.float32),
+    }
+
+def _sample_notes(items, bridge) -> np.ndarray:
+    k = SAMPLE_NOTES_PER_LEVEL
+    by_item: Dict[str, Dict[str, List[str]]] = {}
+    for fid, level, note in zip(bridge['fragrance_id'].astype(str), bridge['level'], bridge['note']):
+        lv = by_item.setdefault(fid, {}).setdefault(level, [])
+        if len(lv) < k:
+            lv.append(note)
+    out = []
+    for fid in items['fragrance_id'].astype(str):
+        notes = by_item.get(fid, {})
+        out.append(f"top: {', '.join(notes.get('top', []))} | mid: {', '.join(notes.get('mid', []))} | base: {', '.join(notes.get('base', []))}")
+    return _str_array(out)
+
+def feature_positions(feature_meta: Dict[str, Any]):
+    """Column positions of every note (per level) and accord in X_sparse, mirroring build_query in the notebook."""
+    feat_pos = {c: i for i, c in enumerate(feature_meta['feature_names'])}
+    note_pos = {
+        level: {n: feat_pos[f"{n}_{level}"] for n in feature_meta[f"{level}_mlb_classes"] if f"{n}_{level}" in feat_pos}
+        for level in ('top', 'mid', 'base')
+    }
+    accord_pos = {a: feat_pos[f"accord_{a}"] for a in feature_meta['accord_vocab'] if f"accord_{a}" in feat_pos}
+    return note_pos, accord_pos
+
+def compile_bundle(art: Path = ART, out: Path = BUNDLE_DIR) -> Dict[str, Any]:
+    """Reads the notebook outputs in `art` and writes a serving bundle to `out`. Returns the index."""
+    import pandas as pd
+
+    art, out = Path(art), Path(out)
+    feature_meta = json.loads((art/'feature_meta.json').read_text())
+    manifest = json.loads((art/'model_manifest.json').read_text())
+    items = pd.read_parquet(art/'items.parquet')
+    bridge = pd.read_parquet(art/'fragrance_note_bridge.parquet')
+
+    arrays: Dict[str, np.ndarray] = {}
+
+    # embeddings
+    arrays['Z_ae'] = np.load(art/'ae_embeddings.npy').astype(np.float32)
+    arrays['Z_svd'] = np.load(art/'svd_embeddings.npy').astype(np.float32)
+    arrays['ZP_ae'] = np.load(art/'persona_ae_embeddings.npy').astype(np.float32)
+    arrays['ZP_svd'] = np.load(art/'persona_svd_embeddings.npy').astype(np.float32)
+    for mode in ('ae', 'svd'):
+        p = art/f'A_item_persona_{mode}.npy'
+        A = np.load(p) if p.exists() else arrays[f'Z_{mode}'] @ arrays[f'ZP_{mode}'].T
+        arrays[f'A_item_persona_{mode}'] = A.astype(np.float32)
+
+    # query encoders as plain matrices
+    arrays['svd_components_t'] = _svd_components(art)
+    arrays.update(_ae_encoder(art))
+
+    note_pos, accord_pos = feature_positions(feature_meta)
+
+    # posting lists for hybrid retrieval / hard constraints
+    from scipy import sparse
+    from inverted_index import compile_postings
+    arrays.update(compile_postings(sparse.load_npz(art/'X_sparse.npz')))
+
+    # items: string/numeric columns, accord ids, gender codes (item_gender stays the string column), sample notes
+    for c in ITEM_STR_COLS:
+        arrays[_file_key(c)] = _str_array(items[c].tolist())
+    for c in ITEM_NUM_COLS:
+        arrays[_file_key(c)] = items[c].to_numpy()
+
+    accords = list(dict.fromkeys(_norm(a) for a in feature_meta['accord_vocab']))
+    acc_id = {a: i for i, a in enumerate(accords)}
+    item_acc = np.full((len(items), 5), -1, dtype=np.int16)
+    for p in range(5):
+        for i, v in enumerate(items[f"mainaccord{p+1}"].tolist()):
+            if pd.isna(v) or not _norm(v) or _norm(v) == 'nan':
+                continue
+            name = _norm(v)
+            if name not in acc_id:
+                acc_id[name] = len(accords); accords.append(name)
+            item_acc[i, p] = acc_id[name]
+    arrays['item_accords'] = item_acc
+
+    genders = sorted({_norm(g) for g in items['Gender'].fillna('').astype(str)})
+    g_id = {g: i for i, g in enumerate(genders)}
+    arrays['item_gender_code'] = np.array([g_id[_norm(g)] for g in items['Gender'].fillna('').astype(str)], dtype=np.int8)
+    arrays['item_sample_notes'] = _sample_notes(items, bridge)
+
+    # write into a staging dir, then swap so running workers never see a half-written bundle
+    stage = out.with_name(out.name + '.tmp')
+    if stage.exists():
+        shutil.rmtree(stage)
+    stage.mkdir(parents=True)
+    h = hashlib.sha1()
+    for name in sorted(arrays):
+        np.save(stage/f'{name}.npy', arrays[name], allow_pickle=False)
+        h.update(name.encode()); h.update((stage/f'{name}.npy').read_bytes())
+
+    index = {
+        'format': BUNDLE_FORMAT,
+        'version': h.hexdigest()[:16],
+        'n_items': int(len(items)),
+        'n_features': len(feature_meta['feature_names']),
+        'cfg': manifest.get('cfg', {}),
+        'arrays': sorted(arrays),
+        'shapes': {k: list(v.shape) for k, v in arrays.items()},
+        'item_str_cols': ITEM_STR_COLS,
+        'item_num_cols': ITEM_NUM_COLS,
+        'note_pos': note_pos,
+        'accord_pos': accord_pos,
+        'accords': accords,
+        'genders': genders,
+    }
+    (stage/'index.json').write_text(json.dumps(index))
+    if out.exists():
+        shutil.rmtree(out)
+    stage.rename(out)
+    return index
+
+class ServingBundle:
+    """
+    Read-only view over a compiled bundle. Arrays are memory-mapped by default, so
+    loading is O(1) and several worker processes share the same page cache.
+    """
+    def __init__(self, path: Path = BUNDLE_DIR, mmap: bool = True):
+        self.path = Path(path)
+        self.index = json.loads((self.path/'index.json').read_text())
+        if self.index.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported bundle format {self.index.get('format')} in {self.path}")
+        self.version = self.index['version']
+        self.cfg = self.index['cfg']
+        mode = 'r' if mmap else None
+        self.arrays = {name: np.load(self.path/f'{name}.npy', mmap_mode=mode, allow_pickle=False)
+                       for name in self.index['arrays']}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def item_col(self, col: str) -> np.ndarray:
+        return self.arrays[_file_key(col)]
+
+def load_bundle(path: Path = BUNDLE_DIR, mmap: bool = True) -> ServingBundle:
+    return ServingBundle(path, mmap=mmap)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--art", type=Path, default=ART, help='Directory with the modelling artifacts.')
+    ap.add_argument("--out", type=Path, default=BUNDLE_DIR, help='Output directory for the serving bundle.')
+    args = ap.parse_args()
+
+    index = compile_bundle(args.art, args.out)
+    print(f"Compiled bundle v{index['version']} ({index['n_items']} items, {len(index['arrays'])} arrays) -> {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""
+catalog_export.py
+-----------------
+Exports the scraped SQLite catalog (database/models.py) to typed, partitioned parquet and builds
+the X_sparse feature matrix from it without a JSON decode or a CSV hop.
+
+Layout under CATALOG_DIR:
+- colognes/bucket=NNNNN/part-0.parquet   one file per BUCKET_SIZE range of cologne ids:
+      id, name, brand (dictionary), launch_year, url, vote counts, updated_at,
+      accord_ids (list<int16>, in rank order), {top,middle,base,general}_note_ids (list<int32>)
+- notes.parquet     note id -> name, group (ids are notes.id)
+- accords.parquet   accord id -> name (append-only, so ids stay stable across exports)
+- _state.json       watermark (+ ids stamped at it), accord vocab and the written buckets
+
+Notes come from the normalized cologne_notes table and accords from colognes.main_accords via
+SQLite's json_each, so no row is decoded in Python. Incremental runs rewrite only buckets with a
+row stamped since the watermark: colognes.updated_at for inserts and edits, colognes_deleted for
+deletes (both kept current by the triggers in database/migrations.py).
+
+Usage (from src/Modelling):
+    python catalog_export.py                  # incremental (full on the first run)
+    python catalog_export.py --full --features
+"""
+from __future__ import annotations
+import os, json, time, shutil, sqlite3, argparse
+from pathlib import Path
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+from scipy import sparse
+
+ART = Path('../../data/processed')
+DB_PATH = Path('../../database/database.db')
+CATALOG_DIR = ART/'catalog'
+STATE_FORMAT = 3
+BUCKET_SIZE = 4096
+
+VOTE_COLS = [
+    "longevity_very_weak", "longevity_weak", "longevity_moderate", "longevity_long_lasting", "longevity_eternal",
+    "sillage_intimate", "sillage_moderate", "sillage_strong", "sillage_enormous",
+    "gender_female", "gender_more_female", "gender_unisex", "gender_more_male", "gender_male",
+    "price_way_overpriced", "price_overpriced", "price_ok", "price_good_value", "price_great_value",
+]
+NOTE_TYPES = {"TOP": "top", "MIDDLE": "middle", "BASE": "base", "GENERAL": "general"}  # NoteType names as stored
+
+# X_sparse blocks, as in Data Cleaning.ipynb
+W_NOTE = {"top": 0.35, "mid": 0.40, "base": 0.25}
+W_ACCORD, W_META = 0.80, 0.20
+ACCORD_POS_WEIGHTS = np.array([1.0, 0.8, 0.6, 0.4, 0.2], dtype=np.float32)
+# pages without a pyramid only list "general" notes; they count as heart notes
+LEVEL_SOURCES = {"top": ("top",), "mid": ("middle", "general"), "base": ("base",)}
+
+def _norm(s: Any) -> str:
+    return str(s).strip().lower()
+
+def check_watermark(con: sqlite3.Connection):
+    cols = {r[1] for r in con.execute("PRAGMA table_info(colognes)")}
+    log = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='colognes_deleted'").fetchone()
+    if 'updated_at' not in cols or log is None:
+        raise RuntimeError("colognes.updated_at / colognes_deleted are missing; migrate the database first: "
+                           "python -m database.migrations <path to database.db> (from the repo root)")
+
+def _watermark(con: sqlite3.Connection) -> Tuple[Any, List[int]]:
+    """Newest change stamp (edits and deletes) and the ids stamped with it."""
+    wm = con.execute("SELECT MAX(t) FROM (SELECT MAX(updated_at) AS t FROM colognes "
+                     "UNION ALL SELECT MAX(deleted_at) FROM colognes_deleted)").fetchone()[0]
+    if wm is None:
+        return None, []
+    ids = con.execute("SELECT id FROM colognes WHERE updated_at = ? "
+                      "UNION SELECT id FROM colognes_deleted WHERE deleted_at = ? ORDER BY 1", (wm, wm))
+    return wm, [i for (i,) in ids]
+
+def _changed_buckets(con: sqlite3.Connection, bucket_size: int, watermark: str, seen: List[int]) -> set:
+    """
+    Buckets with a row inserted, edited or deleted since the last export: stamped after the
+    watermark, or at it but not among the ids already exported at that stamp (same millisecond).
+    Both sides are range scans on the stamp indexes.
+    """
+    seen = set(seen)
+    return {cid // bucket_size for cid, t in con.execute(
+        "SELECT id, updated_at FROM colognes WHERE updated_at >= ? "
+        "UNION ALL SELECT id, deleted_at FROM colognes_deleted WHERE deleted_at >= ?", (watermark, watermark))
+        if t > watermark or cid not in seen}
+
+# ----- export -----
+
+def _read_state(out: Path) -> Dict[str, Any]:
+    p = out/'_state.json'
+    return json.loads(p.read_text()) if p.exists() else None
+
+def _write_atomic(path: Path, write):
+    # dot prefix: pyarrow.dataset skips it while the file is being written
+    tmp = path.with_name('.' + path.name + '.tmp')
+    write(tmp)
+    os.replace(tmp, path)
+
+def _list_array(row_ids: np.ndarray, owners: np.ndarray, values: np.ndarray, typ):
+    """List column from (owner id, value) pairs sorted by owner; rows without values get []."""
+    import pyarrow as pa
+    counts = np.bincount(np.searchsorted(row_ids, owners), minlength=len(row_ids))
+    offsets = np.zeros(len(row_ids) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.array(values, type=typ))
+
+def _bucket_table(con: sqlite3.Connection, lo: int, hi: int, accord_id: Dict[str, int], accords: List[str]):
+    import pyarrow as pa, pyarrow.compute as pc
+
+    cols = ["id", "name", "brand", "launch_year", "url", *VOTE_COLS, "updated_at"]
+    rows = con.execute(f"SELECT {', '.join(cols)} FROM colognes WHERE id >= ? AND id < ? ORDER BY id", (lo, hi)).fetchall()
+    data = dict(zip(cols, zip(*rows))) if rows else {c: () for c in cols}
+    ids = np.asarray(data['id'], dtype=np.int64)
+
+    owners, aids = [], []
+    for cid, name in con.execute(
+            "SELECT c.id, j.value FROM colognes c, json_each(c.main_accords) j "
+            "WHERE c.id >= ? AND c.id < ? AND json_valid(c.main_accords) ORDER BY c.id, j.key", (lo, hi)):
+        name = _norm(name) if name is not None else ''
+        if not name:
+            continue
+        if name not in accord_id:
+            accord_id[name] = len(accords)
+            accords.append(name)
+        owners.append(cid); aids.append(accord_id[name])
+
+    note_rows = con.execute(
+        "SELECT cn.cologne_id, cn.note_id, cn.note_type FROM cologne_notes cn JOIN colognes c ON c.id = cn.cologne_id "
+        "WHERE cn.cologne_id >= ? AND cn.cologne_id < ? ORDER BY cn.cologne_id, cn.id", (lo, hi)).fetchall()
+    n_owner = np.fromiter((r[0] for r in note_rows), dtype=np.int64, count=len(note_rows))
+    n_id = np.fromiter((r[1] for r in note_rows), dtype=np.int32, count=len(note_rows))
+    n_type = np.array([str(r[2]) for r in note_rows], dtype=object)
+
+    columns = {
+        "id": pa.array(ids, pa.int32()),
+        "name": pa.array(data['name'], pa.string()),
+        "brand": pa.array(data['brand'], pa.string()).dictionary_encode(),
+        "launch_year": pa.array(data['launch_year'], pa.int16()),
+        "url": pa.array(data['url'], pa.string()),
+    }
+    for c in VOTE_COLS:
+        columns[c] = pa.array(data[c], pa.int32())
+    columns["updated_at"] = pc.cast(pa.array(data['updated_at'], pa.string()), pa.timestamp('us'))
+    columns["accord_ids"] = _list_array(ids, np.asarray(owners, dtype=np.int64), np.asarray(aids, dtype=np.int16), pa.int16())
+    for stored, level in NOTE_TYPES.items():
+        m = n_type == stored
+        columns[f"{level}_note_ids"] = _list_array(ids, n_owner[m], n_id[m], pa.int32())
+    return pa.table(columns)
+
+def export_catalog(db: Path = DB_PATH, out: Path = CATALOG_DIR, full: bool = False,
+                   bucket_size: int = BUCKET_SIZE) -> Dict[str, Any]:
+    """Writes/refreshes the parquet catalog. Returns counts of rewritten and dropped buckets."""
+    import pyarrow as pa, pyarrow.parquet as pq
+
+    con = sqlite3.connect(Path(db).resolve().as_uri() + '?mode=ro', uri=True)
+    try:
+        check_watermark(con)
+        state = None if full else _read_state(out)
+        if state is not None and (state.get('format') != STATE_FORMAT or state.get('bucket_size') != bucket_size):
+            state = None
+        if state is None:
+            shutil.rmtree(out/'colognes', ignore_errors=True)
+            state = {"format": STATE_FORMAT, "bucket_size": bucket_size, "watermark": None, "watermark_ids": [],
+                     "accords": [], "buckets": []}
+
+        # taken before reading rows: anything written meanwhile is stamped at or after it
+        watermark, watermark_ids = _watermark(con)
+        if state['watermark'] is None:
+            dirty = {b for (b,) in con.execute("SELECT DISTINCT id / ? FROM colognes", (bucket_size,))}
+        else:
+            dirty = _changed_buckets(con, bucket_size, state['watermark'], state['watermark_ids'])
+
+        buckets = set(state['buckets'])
+        accords: List[str] = list(state['accords'])
+        accord_id = {a: i for i, a in enumerate(accords)}
+        rewritten = dropped = 0
+        for b in sorted(dirty):
+            lo = b * bucket_size
+            table = _bucket_table(con, lo, lo + bucket_size, accord_id, accords)
+            d = out/'colognes'/f"bucket={b:05d}"
+            if table.num_rows == 0:   # every row in it was deleted
+                shutil.rmtree(d, ignore_errors=True)
+                dropped += b in buckets
+                buckets.discard(b)
+                continue
+            d.mkdir(parents=True, exist_ok=True)
+            _write_atomic(d/'part-0.parquet', lambda p: pq.write_table(table, p, compression='zstd'))
+            buckets.add(b)
+            rewritten += 1
+
+        notes = con.execute('SELECT id, name, "group" FROM notes ORDER BY id').fetchall()
+        ncols = list(zip(*notes)) if notes else [(), (), ()]
+        notes_t = pa.table({"id": pa.array(ncols[0], pa.int32()), "name": pa.array(ncols[1], pa.string()),
+                            "group": pa.array(ncols[2], pa.string()).dictionary_encode()})
+        _write_atomic(out/'notes.parquet', lambda p: pq.write_table(notes_t, p))
+        accords_t = pa.table({"id": pa.array(range(len(accords)), pa.int16()), "name": pa.array(accords, pa.string())})
+        _write_atomic(out/'accords.parquet', lambda p: pq.write_table(accords_t, p))
+
+        state.update({"watermark": watermark, "watermark_ids": watermark_ids, "accords": accords,
+                      "buckets": sorted(buckets)})
+        _write_atomic(out/'_state.json', lambda p: p.write_text(json.dumps(state)))
+        return {"rewritten": rewritten, "dropped": dropped, "buckets": len(buckets), "watermark": watermark}
+    finally:
+        con.close()
+
+# ----- features -----
+
+def load_catalog(out: Path = CATALOG_DIR):
+    """(colognes, notes, accords) Arrow tables; colognes sorted by id with contiguous columns."""
+    import pyarrow.dataset as ds, pyarrow.parquet as pq
+    colognes = ds.dataset(out/'colognes', format='parquet', partitioning='hive').to_table()
+    colognes = colognes.unify_dictionaries().sort_by('id').combine_chunks()
+    return colognes, pq.read_table(out/'notes.parquet'), pq.read_table(out/'accords.parquet')
+
+def _list_parts(col) -> Tuple[np.ndarray, np.ndarray]:
+    """(offsets, values) of a list column, viewed without copying."""
+    arr = col.chunk(0) if col.num_chunks == 1 else col.combine_chunks()
+    offsets = arr.offsets.to_numpy()
+    values = arr.values.to_numpy()[offsets[0]:offsets[-1]]
+    return offsets - offsets[0], values
+
+def _float_col(table, name: str) -> np.ndarray:
+    return table[name].cast('float64').fill_null(float('nan')).to_numpy()
+
+def l2_row_normalize_csr(X: sparse.csr_matrix) -> sparse.csr_matrix:
+    rn = np.sqrt(X.power(2).sum(axis=1)).A1
+    rn[rn == 0.0] = 1.0
+    return X.multiply(1.0 / rn[:, None]).tocsr()
+
+def z_score(x: np.ndarray) -> np.ndarray:
+    mu, sd = x.mean(), x.std()
+    return (x - mu) / (sd if sd else 1.0)
+
+def fill_year(year: np.ndarray, brands: List[Any]) -> np.ndarray:
+    """Brand-aware median imputation as in Data Cleaning.ipynb: brand median, else global median."""
+    year = year.copy()
+    missing = np.isnan(year)
+    if not missing.any():
+        return year
+    glob = np.nanmedian(year) if (~missing).any() else 0.0
+    brand = np.array(["" if b is None else str(b) for b in brands], dtype=object)
+    known = np.array([b is not None for b in brands], dtype=bool)   # groupby drops null brands
+    for b in set(brand[missing & known]):
+        same = brand == b
+        vals = year[same & ~missing]
+        if vals.size:
+            year[same & missing] = np.median(vals)
+    year[np.isnan(year)] = glob
+    return year
+
+def catalog_matrix(out: Path = CATALOG_DIR) -> Tuple[sparse.csr_matrix, Dict[str, Any]]:
+    """
+    X_sparse and feature_meta (same blocks, weights and meta keys as Data Cleaning.ipynb) from the
+    parquet catalog. Note/accord id lists become CSR indices through vectorized id -> column maps.
+    The database has no ratings, so weighted_rating_z is 0 and log_count_z uses the gender vote count.
+    """
+    colognes, notes, accords = load_catalog(out)
+    n = colognes.num_rows
+    note_ids = notes['id'].to_numpy()
+    note_names = np.array([_norm(x) for x in notes['name'].to_pylist()], dtype=object)
+    name_of = np.empty(int(note_ids.max()) + 1 if len(note_ids) else 1, dtype=object)
+    name_of[note_ids] = note_names
+
+    blocks, classes = [], {}
+    for level, sources in LEVEL_SOURCES.items():
+        parts = [_list_parts(colognes[f"{s}_note_ids"]) for s in sources]
+        if len(parts) == 1:
+            offsets, values = parts[0]
+        else:   # concatenate the source lists row by row
+            counts = sum(np.diff(o) for o, _ in parts)
+            offsets = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            rows = np.concatenate([np.repeat(np.arange(n), np.diff(o)) for o, _ in parts])
+            order = np.argsort(rows, kind='stable')
+            values = np.concatenate([v for _, v in parts])[order]
+        u = np.unique(values)
+        cls, inv = np.unique(name_of[u].astype(str), return_inverse=True)   # sorted, like MultiLabelBinarizer
+        col_of = np.zeros(name_of.size, dtype=np.int32)
+        col_of[u] = inv
+        Xl = sparse.csr_matrix((np.ones(values.size, dtype=np.float32), col_of[values], np.array(offsets)),
+                               shape=(n, cls.size))
+        Xl.sum_duplicates()
+        Xl.data[:] = 1.0
+        blocks.append(W_NOTE[level] * Xl)
+        classes[level] = cls.tolist()
+    X_notes = l2_row_normalize_csr(sparse.hstack(blocks).tocsr())
+
+    offsets, values = _list_parts(colognes['accord_ids'])
+    counts = np.diff(offsets)
+    pos = np.arange(values.size) - np.repeat(offsets[:-1], counts)
+    keep = pos < ACCORD_POS_WEIGHTS.size          # mainaccord1..5
+    kept_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.minimum(counts, ACCORD_POS_WEIGHTS.size), out=kept_offsets[1:])
+    a_vals = values[keep].astype(np.int64)
+    present = np.unique(a_vals)                  # ids are first-seen order, so this keeps it
+    col_of = np.zeros(accords.num_rows, dtype=np.int32)
+    col_of[present] = np.arange(present.size)
+    X_acc = sparse.csr_matrix((ACCORD_POS_WEIGHTS[pos[keep]], col_of[a_vals], kept_offsets),
+                              shape=(n, present.size))
+    X_acc.sum_duplicates()
+    accord_vocab = [accords['name'][int(i)].as_py() for i in present]
+    X_acc = l2_row_normalize_csr(X_acc) * W_ACCORD
+
+    brands, names = colognes['brand'].to_pylist(), colognes['name'].to_pylist()
+    year = fill_year(_float_col(colognes, 'launch_year'), brands)
+    votes = sum(_float_col(colognes, c) for c in ("gender_female", "gender_more_female", "gender_unisex", "gender_more_male", "gender_male"))
+    M = np.vstack([np.zeros(n), z_score(np.log1p(np.nan_to_num(votes))), z_score(year)]).T
+    meta_cols = ['weighted_rating_z', 'log_count_z', 'recency_z']
+    X_meta = l2_row_normalize_csr(sparse.csr_matrix(M)) * W_META
+
+    X = sparse.hstack([X_notes, X_acc, X_meta]).tocsr().astype(np.float32)
+
+    acc_cols = [f"accord_{a}" for a in accord_vocab]
+    row_index = [{"fragrance_id": f"{b}|{p}|{int(y)}", "Brand": b, "Perfume": p, "Year": int(y)}
+                 for b, p, y in zip(brands, names, year)]
+    feature_meta = {
+        'top_mlb_classes': classes['top'],
+        'mid_mlb_classes': classes['mid'],
+        'base_mlb_classes': classes['base'],
+        'accord_vocab': accord_vocab,
+        'accord_cols': acc_cols,
+        'meta_cols': meta_cols,
+        'weights': {'notes': W_NOTE, 'accord': W_ACCORD, 'meta': W_META},
+        'row_index': row_index,
+        'feature_names': ([f"{c}_top" for c in classes['top']] + [f"{c}_mid" for c in classes['mid']] +
+                          [f"{c}_base" for c in classes['base']] + acc_cols + meta_cols),
+    }
+    return X, feature_meta
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--out", type=Path, default=CATALOG_DIR)
+    ap.add_argument("--full", action='store_true', help='Rewrite every bucket instead of changes since the watermark.')
+    ap.add_argument("--bucket-size", type=int, default=BUCKET_SIZE)
+    ap.add_argument("--features", action='store_true', help='Also write X_sparse.npz + feature_meta.json into --out.')
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    res = export_catalog(args.db, args.out, full=args.full, bucket_size=args.bucket_size)
+    print(f"exported {res['rewritten']}/{res['buckets']} buckets ({res['dropped']} dropped) "
+          f"in {time.perf_counter() - t0:.2f}s, watermark {res['watermark']}")
+    if args.features:
+        t0 = time.perf_counter()
+        X, feature_meta = catalog_matrix(args.out)
+        sparse.save_npz(args.out/'X_sparse.npz', X)
+        (args.out/'feature_meta.json').write_text(json.dumps(feature_meta, indent=2))
+        print(f"X_sparse {X.shape} nnz={X.nnz} in {time.perf_counter() - t0:.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,12 @@ OpenAI API LLM powered explanations for fragrance explanations.
 """
 from __future__ import annotations
 import os
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Dict, List, Any, TYPE_CHECKING
 from dotenv import load_dotenv
-import pandas as pd
-from openai import OpenAI
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 load_dotenv()
 
@@ -17,7 +19,11 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 TEMPERATURE = 0.2
 BATCH_SIZE = 8
 
-client = OpenAI(api_key=API_KEY)
+@lru_cache(maxsize=1)
+def get_client():
+    "Builds the OpenAI client on first use, so importing this module stays cheap."
+    from openai import OpenAI
+    return OpenAI(api_key=API_KEY)
 
 def prompt(item_row: Dict[str, Any], preference: Dict[str, Any]) -> str:
     """
@@ -68,6 +74,7 @@ def generate(df: pd.DataFrame, preference: Dict[str, Any], model: str = DEFAULT_
     "Returns a list of explanations aligned with df rows. Fails soft per-row (keeps your recommender fully functional)"
     prompts = [prompt(r.asdict() if hasattr(r,'_asdict') else r.to_dict(), preference) for _,r in df.iterrows()]
     out = [''] * len(prompts)
+    client = get_client()
     for start in range(0,len(prompts), batch_size):
         for i in range(start, min(start + batch_size, len(prompts))):
             try:
@@ -0,0 +1,124 @@
+"""
+inverted_index.py
+-----------------
+Inverted index over the X_sparse columns (note_level and accord features -> posting lists of
+item ids), compiled into the serving bundle as CSC arrays:
+
+- inv_indptr  (D+1,)  posting list of column j is inv_items[inv_indptr[j]:inv_indptr[j+1]]
+- inv_items   (nnz,)  item ids, ascending within each posting list
+- inv_weights (nnz,)  the X_sparse value for (item, column)
+
+Set algebra runs on boolean bitmaps over the catalog (23k items -> 23 KB each), which is
+cheaper than merging sorted posting lists at this size.
+"""
+from __future__ import annotations
+from typing import Dict, List, Iterable, Tuple
+
+import numpy as np
+
+LEVELS = ("top", "mid", "base")
+
+def _norm(s) -> str:
+    return str(s).strip().lower()
+
+def _names(x) -> list:
+    # parquet-backed personas hold numpy arrays, so no `x or []`
+    return [] if x is None else list(x)
+
+def compile_postings(X) -> Dict[str, np.ndarray]:
+    """CSC posting arrays for a scipy sparse item x feature matrix (used by bundle.compile_bundle)."""
+    C = X.tocsc()
+    C.sort_indices()
+    return {
+        'inv_indptr': C.indptr.astype(np.int64),
+        'inv_items': C.indices.astype(np.int32),
+        'inv_weights': C.data.astype(np.float32),
+    }
+
+class InvertedIndex:
+    def __init__(self, indptr: np.ndarray, items: np.ndarray, weights: np.ndarray, n_items: int,
+                 note_pos: Dict[str, Dict[str, int]], accord_pos: Dict[str, int]):
+        self.indptr, self.items, self.weights = indptr, items, weights
+        self.n_items = n_items
+        self.note_pos, self.accord_pos = note_pos, accord_pos
+
+    @classmethod
+    def from_bundle(cls, bundle) -> "InvertedIndex":
+        idx = bundle.index
+        return cls(bundle['inv_indptr'], bundle['inv_items'], bundle['inv_weights'], idx['n_items'],
+                   idx['note_pos'], idx['accord_pos'])
+
+    # ----- vocab -> columns -----
+
+    def note_cols(self, names: Iterable[str]) -> List[List[int]]:
+        """For each note name, its columns across top/mid/base (a note matches at any level)."""
+        out = []
+        for n in names:
+            n = _norm(n)
+            out.append([self.note_pos[l][n] for l in LEVELS if n in self.note_pos[l]])
+        return out
+
+    def accord_cols(self, names: Iterable[str]) -> List[List[int]]:
+        out = []
+        for a in names:
+            j = self.accord_pos.get(_norm(a))
+            out.append([j] if j is not None else [])
+        return out
+
+    # ----- postings & set algebra -----
+
+    def postings(self, col: int) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = self.indptr[col], self.indptr[col + 1]
+        return self.items[lo:hi], self.weights[lo:hi]
+
+    def bitmap(self, cols: Iterable[int]) -> np.ndarray:
+        """Items having a nonzero value in any of `cols` (union of posting lists)."""
+        m = np.zeros(self.n_items, dtype=bool)
+        for j in cols:
+            m[self.postings(j)[0]] = True
+        return m
+
+    def any_of(self, groups: List[List[int]]) -> np.ndarray:
+        return self.bitmap(j for g in groups for j in g)
+
+    def all_of(self, groups: List[List[int]]) -> np.ndarray:
+        """Items matching every group; a group (e.g. one note at any level) matches via any of its columns."""
+        m = np.ones(self.n_items, dtype=bool)
+        for g in groups:
+            m &= self.bitmap(g)
+        return m
+
+    def constraint_mask(self, pref: dict) -> np.ndarray:
+        """
+        Allowed items under the hard constraints in a preference:
+          - avoid_notes / disliked_accords: exclude items containing any of them
+          - must_notes / must_accords: keep only items containing all of them
+        Returns None when the preference has no constraints.
+        """
+        avoid, disliked = _names(pref.get("avoid_notes")), _names(pref.get("disliked_accords"))
+        must_n, must_a = _names(pref.get("must_notes")), _names(pref.get("must_accords"))
+        if not (avoid or disliked or must_n or must_a):
+            return None
+
+        allowed = np.ones(self.n_items, dtype=bool)
+        if must_n or must_a:
+            # an unknown required name can't be satisfied by any item
+            groups = self.note_cols(must_n) + self.accord_cols(must_a)
+            allowed = self.all_of(groups) if all(groups) else np.zeros(self.n_items, dtype=bool)
+        if avoid or disliked:
+            allowed &= ~self.any_of(self.note_cols(avoid) + self.accord_cols(disliked))
+        return allowed
+
+    def score(self, cols: np.ndarray, vals: np.ndarray) -> np.ndarray:
+        """Sparse dot product X @ q for a query given as (cols, vals), over the whole catalog."""
+        if len(cols) == 0:
+            return np.zeros(self.n_items, dtype=np.float32)
+        spans = [self.postings(int(j)) for j in cols]
+        items = np.concatenate([s[0] for s in spans])
+        w = np.concatenate([s[1] * v for s, v in zip(spans, vals)])
+        return np.bincount(items, weights=w, minlength=self.n_items).astype(np.float32)
+
+    def violations(self, pref: dict, item_ids: Iterable[int]) -> int:
+        """How many of `item_ids` break the preference's hard constraints (for evaluation)."""
+        mask = self.constraint_mask(pref)
+        return 0 if mask is None else int((~mask[np.asarray(list(item_ids), dtype=np.int64)]).sum())
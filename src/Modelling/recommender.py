@@ -0,0 +1,529 @@
+"""
+recommender.py
+--------------
+Serving-side recommender: query building, KNN retrieval, persona boost, context bias and MMR,
+ported from Modelling.ipynb to run on a compiled serving bundle (see bundle.py).
+
+Only numpy is needed at import time. pandas is imported when a DataFrame is requested and
+openai only when LLM explanations are attached.
+"""
+from __future__ import annotations
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+
+from bundle import ServingBundle, load_bundle, BUNDLE_DIR
+from inverted_index import InvertedIndex
+from result_cache import ResultCache, cache_key
+
+W_NOTE = {"top": 0.35, "mid": 0.40, "base": 0.25}
+
+W_BLOCK = {"accord": 0.80, "meta": 0.20}
+
+ACCORD_POS_WEIGHTS = np.array([1.0, 0.8, 0.6, 0.4, 0.2], dtype=np.float32)
+DEFAULT_ACCORD_WEIGHT = 0.6
+
+SEASON_TO_ACCORD_HINTS = {
+    "summer": {
+        "boost": {
+            "citrus", "aquatic", "ozonic", "green", "aromatic", "fresh", "fresh spicy",
+            "fruity", "marine", "soapy", "tropical", "salty", "coconut", "musky"
+        },
+        "penalize": {
+            "amber", "sweet", "gourmand", "smoky", "leather", "tobacco", "vanilla", "balsamic",
+            "oud", "chocolate", "honey", "coffee", "oriental"
+        },
+    },
+    "spring": {
+        "boost": {
+            "floral", "white floral", "green", "citrus", "aromatic", "fresh", "fresh spicy",
+            "violet", "rose", "herbal", "aldehydic", "powdery", "lavender"
+        },
+        "penalize": {
+            "animalic", "leather", "oud", "smoky", "tobacco", "gourmand"
+        },
+    },
+    "fall": {
+        "boost": {
+            "woody", "warm spicy", "amber", "tobacco", "leather", "balsamic",
+            "patchouli", "vanilla", "cinnamon", "honey", "earthy", "mossy",
+            "oriental", "coffee", "chocolate"
+        },
+        "penalize": {
+            "aquatic", "ozonic", "marine", "soapy", "fresh"
+        },
+    },
+    "winter": {
+        "boost": {
+            "amber", "vanilla", "sweet", "smoky", "leather", "balsamic", "oud", "tobacco",
+            "whiskey", "rum", "wine", "chocolate", "cacao", "coffee",
+            "spicy", "warm spicy", "oriental", "honey", "almond", "nutty", "powdery", "musky"
+        },
+        "penalize": {
+            "aquatic", "green", "ozonic", "citrus", "fresh", "marine", "tropical", "coconut"
+        },
+    },
+}
+
+USE_CASE_HINTS = {
+    "office": {
+        "boost": {
+            "citrus", "aromatic", "green", "woody", "fresh spicy", "musky", "powdery", "soapy", "ozonic"
+        },
+        "penalize": {
+            "animalic", "oud", "smoky", "leather", "gourmand", "sweet", "tobacco",
+            "alcohol", "rum", "whiskey", "wine", "vodka", "champagne",
+            "coffee", "chocolate", "honey", "cannabis"
+        },
+    },
+    "date": {
+        "boost": {
+            "vanilla", "amber", "sweet", "fruity", "warm spicy", "soft spicy",
+            "white floral", "rose", "musky", "powdery",
+            "chocolate", "honey", "coconut", "tropical", "almond", "caramel", "lactonic", "creamy"
+        },
+        "penalize": {
+            "aquatic", "ozonic", "green", "aldehydic", "soapy", "metallic", "marine", "fresh"
+        },
+    },
+    "gym": {
+        "boost": {
+            "citrus", "green", "aquatic", "ozonic", "aromatic", "fresh", "fresh spicy",
+            "soapy", "musky", "marine", "herbal"
+        },
+        "penalize": {
+            "sweet", "gourmand", "amber", "vanilla", "oud", "smoky", "leather", "tobacco",
+            "honey", "chocolate", "coffee", "coconut", "oriental", "balsamic"
+        },
+    },
+    "casual": {
+        "boost": {
+            "citrus", "fruity", "aromatic", "green", "aquatic", "fresh", "fresh spicy",
+            "musky", "woody", "soapy", "ozonic"
+        },
+        "penalize": {
+            "animalic", "oud", "leather", "tobacco", "smoky", "gourmand", "sweet", "coffee", "cannabis"
+        },
+    },
+    "formal": {
+        "boost": {
+            "woody", "iris", "aldehydic", "amber", "leather", "powdery", "rose",
+            "spicy", "soft spicy", "warm spicy", "patchouli", "musky", "balsamic", "violet", "oriental"
+        },
+        "penalize": {
+            "gourmand", "sweet", "aquatic", "ozonic", "fruity", "tropical", "coconut", "cherry"
+        },
+    },
+    "signature": {
+        "boost": {
+            "citrus", "aromatic", "woody", "green", "fresh spicy", "musky", "powdery", "soapy",
+            "floral", "white floral", "ozonic"
+        },
+        "penalize": {
+            "animalic", "oud", "smoky", "tobacco", "gourmand", "sweet", "leather",
+            "coffee", "cannabis", "oriental"
+        },
+    },
+}
+
+INTENSITY_WEIGHT = {"soft": -0.10, "moderate": 0.0, "loud": +0.10}
+
+CFG = {
+    "knn_neighbors": 1000,      # recall pool size before MMR
+    "mmr_lambda": 0.40,         # 0.6 relevance / 0.4 diversity
+    "topk": 20,                 # final list length
+}
+
+# rank() defaults, spelled out so cache keys are the same whether an option is passed or not
+RANK_DEFAULTS = {"top_k": CFG["topk"], "beta_persona": 0.35, "mmr_lambda": CFG["mmr_lambda"],
+                 "top_personas": 20, "temperature": 0.2, "use_context_bias": True}
+
+RETRIEVALS = ('dense', 'hybrid')
+ALPHA_SPARSE = 0.30             # weight of the sparse X_sparse·q score in hybrid retrieval
+
+RESULT_COLS = ["fragrance_id","Brand","Perfume","Year","Gender",
+               "mainaccord1","mainaccord2","mainaccord3","mainaccord4","mainaccord5",
+               "Weighted Rating","Rating Count","url"]
+
+def _norm(s: Any) -> str:
+    return str(s).strip().lower()
+
+def _as_list(x) -> list:
+    # parquet-backed personas hold numpy arrays, which can't be used with `x or []`
+    return [] if x is None else list(x)
+
+def _rank_weight(rank: int) -> float:
+    return float(ACCORD_POS_WEIGHTS[rank-1]) if 1 <= rank <= 5 else 0.0
+
+def gender_ok(row_gender: str, pref: str) -> bool:
+    g = (row_gender or "").strip().lower()
+    p = (pref or "").strip().lower()
+    if not p: return True
+    if p == "unisex":         return g in {"unisex"}
+    if p == "men":            return g in {"men","unisex"}
+    if p == "women":          return g in {"women","unisex"}
+    # if user is strict, you could enforce equality only:
+    return g == p
+
+def build_query(pref: dict, note_pos: Dict[str, Dict[str, int]], accord_pos: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the query as (cols, vals) in the **same feature space and order** as X_sparse
+    (positions come from bundle.feature_positions).
+    Blocks & weights mirror training (see build_query in Modelling.ipynb):
+      - Notes: per-level weight (top/mid/base) + per-block L2, avoid notes with NEGATIVE weight
+      - Accords: rank weights [1,.8,.6,.4,.2] + per-block L2, then × W_BLOCK["accord"]
+      - Disliked accords: NEGATIVE default weight (no rank) in accord block
+      - Meta: neutral
+    """
+    notes: Dict[int, float] = {}
+    for level_key, level in [("liked_notes_top", "top"), ("liked_notes_mid", "mid"), ("liked_notes_base", "base")]:
+        for n in map(str, _as_list(pref.get(level_key))):
+            j = note_pos[level].get(_norm(n))
+            if j is not None:
+                notes[j] = notes.get(j, 0.0) + W_NOTE[level]
+    for n in map(str, _as_list(pref.get("avoid_notes"))):
+        for level in ("top", "mid", "base"):
+            j = note_pos[level].get(_norm(n)) if n in note_pos[level] else None
+            if j is not None:
+                notes[j] = notes.get(j, 0.0) - W_NOTE[level]
+
+    acc: Dict[int, float] = {}
+    used_ranks = set()
+    for entry in _as_list(pref.get("liked_accords_ranked")):
+        name = _norm(entry.get("name", ""))
+        rank = int(entry.get("rank", 0))
+        if not (1 <= rank <= 5) or rank in used_ranks:
+            continue
+        j = accord_pos.get(name)
+        if j is None:
+            continue
+        acc[j] = acc.get(j, 0.0) + _rank_weight(rank)
+        used_ranks.add(rank)
+    for name in map(str, _as_list(pref.get("disliked_accords"))):
+        j = accord_pos.get(_norm(name))
+        if j is not None:
+            acc[j] = acc.get(j, 0.0) - DEFAULT_ACCORD_WEIGHT
+
+    cols, vals = [], []
+    for block, scale in ((notes, 1.0), (acc, W_BLOCK["accord"])):
+        v = np.fromiter(block.values(), dtype=np.float32, count=len(block))
+        n = float(np.sqrt((v * v).sum()))
+        cols.extend(block.keys())
+        vals.append(v if n == 0 else v * (scale / n))
+    return np.asarray(cols, dtype=np.int64), np.concatenate(vals).astype(np.float32)
+
+def mmr_from_relevance(rel_scores: np.ndarray,
+                       cand_vecs: np.ndarray,
+                       cand_ids: np.ndarray,
+                       lambda_relevance: float = CFG["mmr_lambda"],
+                       top_k: int = CFG["topk"]) -> list:
+    """
+    MMR using precomputed relevance scores for each candidate (rel_scores ~ length m),
+    and candidate embeddings for diversity (cand_vecs ~ (m×d), L2-normalized rows).
+    The redundancy term is updated incrementally with the last pick instead of recomputing |S|×|rest|.
+    """
+    rel = np.asarray(rel_scores, dtype=np.float32).ravel()
+    m = len(cand_ids)
+    assert rel.shape[0] == m and cand_vecs.shape[0] == m, "rel_scores and cand_vecs must align"
+    if m == 0 or top_k <= 0:
+        return []
+
+    taken = np.zeros(m, dtype=bool)
+    max_sim = np.full(m, -np.inf, dtype=np.float32)
+    selected = [int(np.argmax(rel))]
+    taken[selected[0]] = True
+    for _ in range(1, min(top_k, m)):
+        # max similarity to the already selected set (diversity term)
+        np.maximum(max_sim, cand_vecs @ cand_vecs[selected[-1]], out=max_sim)
+
+        # MMR score = λ·relevance − (1−λ)·redundancy
+        score = lambda_relevance * rel - (1.0 - lambda_relevance) * max_sim
+        score[taken] = -np.inf
+        j = int(np.argmax(score))
+        selected.append(j); taken[j] = True
+
+    return [cand_ids[i] for i in selected]
+
+def persona_boost(zq_vec: np.ndarray,
+                  Z_persona: np.ndarray,
+                  A_item_persona: np.ndarray,
+                  cand_ids: np.ndarray,
+                  top_personas: int = 12,
+                  temperature: float = 0.1) -> np.ndarray:
+    """
+    Compute a collaborative 'people-like-you' score for candidate items using precomputed item-to-persona affinities.
+    """
+    #similiarity of query to each persona
+    sim_p = Z_persona @ zq_vec
+
+    # focus on top persona matches; suppress noise from weakly similar personas
+    if top_personas and top_personas < sim_p.size:
+        keep = np.argpartition(-sim_p,top_personas)[:top_personas]
+        mask = np.full_like(sim_p, -np.inf, dtype=np.float32)
+        mask[keep] = sim_p[keep]
+        sim_p=mask
+
+    # softmax weights over personas
+    x = sim_p / max(1e-6, float(temperature))
+    x = x - np.nanmax(x[np.isfinite(x)])
+    w = np.exp(np.where(np.isfinite(x), x, -1e9))
+    w = w / (w.sum() + 1e-9)  # (P,)
+
+    # persona boost for the specific candidates: (m×P) @ (P,) → (m,)
+    boost = A_item_persona[cand_ids] @ w
+
+    # scale to 0..1 for stable blending
+    bmin, bmax = boost.min(), boost.max()
+    return ((boost - bmin) / (bmax - bmin + 1e-9)).astype('float32')
+
+class Recommender:
+    """
+    Recommender over a ServingBundle. Everything derived from the bundle (vocab positions,
+    accord hint masks, gender codes) is computed once here, so per-request work is array ops only.
+    With a ResultCache attached, recommend_records()/recommend() answer repeated requests from it.
+    """
+    def __init__(self, bundle: ServingBundle, cache: ResultCache = None):
+        self.bundle = bundle
+        self.cache = cache
+        self.version = bundle.version
+        idx = bundle.index
+        self.n_features = idx['n_features']
+        self.note_pos: Dict[str, Dict[str, int]] = idx['note_pos']
+        self.accord_pos: Dict[str, int] = idx['accord_pos']
+        self.accords: List[str] = idx['accords']
+        self.accord_id = {a: i for i, a in enumerate(self.accords)}
+        self.genders: List[str] = idx['genders']
+        self.knn_neighbors = int(bundle.cfg.get('knn_neighbors', CFG['knn_neighbors']))
+
+        self.index = InvertedIndex.from_bundle(bundle)
+        self.item_accords = bundle['item_accords']
+        self.item_gender_code = bundle['item_gender_code']
+        self.season_masks = {k: self._hint_masks(v) for k, v in SEASON_TO_ACCORD_HINTS.items()}
+        self.use_case_masks = {k: self._hint_masks(v) for k, v in USE_CASE_HINTS.items()}
+
+    @classmethod
+    def load(cls, path=BUNDLE_DIR, mmap: bool = True, cache: ResultCache = None) -> "Recommender":
+        return cls(load_bundle(path, mmap=mmap), cache=cache)
+
+    def _accord_mask(self, names) -> np.ndarray:
+        # one extra slot so the -1 padding in item_accords indexes a False entry
+        m = np.zeros(len(self.accords) + 1, dtype=bool)
+        for a in names:
+            i = self.accord_id.get(_norm(a))
+            if i is not None:
+                m[i] = True
+        return m
+
+    def _hint_masks(self, hints: Dict[str, set]) -> Tuple[np.ndarray, np.ndarray]:
+        return self._accord_mask(hints['boost']), self._accord_mask(hints['penalize'])
+
+    # ----- query building & encoding -----
+
+    def build_query(self, pref: dict) -> Tuple[np.ndarray, np.ndarray]:
+        return build_query(pref, self.note_pos, self.accord_pos)
+
+    def encode(self, prefs: List[dict], mode: str = 'ae', queries: List[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+        """Encodes a batch of preferences to (B×d) L2-normalized query embeddings. Pass `queries` if already built."""
+        b = self.bundle
+        if queries is None:
+            queries = [self.build_query(p) for p in prefs]
+        if mode == 'ae':
+            H = np.stack([b['ae_w1t'][c].T @ v for c, v in queries]) if queries else np.zeros((0, b['ae_b1'].size), np.float32)
+            H = np.maximum(H + b['ae_b1'], 0.0)
+            Z = H @ b['ae_w2'].T + b['ae_b2']
+            Z = Z / (np.linalg.norm(Z, axis=1, keepdims=True) + 1e-9)
+        else:
+            Ct = b['svd_components_t']
+            Z = np.stack([Ct[c].T @ v for c, v in queries]) if queries else np.zeros((0, Ct.shape[1]), np.float32)
+            nrm = np.linalg.norm(Z, axis=1, keepdims=True)
+            nrm[nrm == 0.0] = 1.0
+            Z = Z / nrm
+        return Z.astype(np.float32)
+
+    # ----- retrieval & ranking -----
+
+    def knn(self, ZQ: np.ndarray, mode: str = 'ae', n_neighbors: int = None) -> np.ndarray:
+        """Exact cosine KNN over the catalog for a (B×d) batch of queries. Returns (B×n) item ids, nearest first."""
+        Z = self.bundle[f'Z_{mode}']
+        n = min(n_neighbors or self.knn_neighbors, Z.shape[0])
+        S = np.atleast_2d(ZQ) @ Z.T   # rows are L2-normalized, so cosine == dot
+        part = np.argpartition(-S, n - 1, axis=1)[:, :n]
+        order = np.argsort(-np.take_along_axis(S, part, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(part, order, axis=1)
+
+    def retrieve(self, prefs: List[dict], ZQ: np.ndarray, mode: str = 'ae', retrieval: str = 'hybrid',
+                 alpha_sparse: float = ALPHA_SPARSE, n_neighbors: int = None,
+                 queries: List[Tuple[np.ndarray, np.ndarray]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Candidate pools for a batch of encoded queries. Returns (cand_ids, sparse_scores) per query,
+        with sparse_scores over the whole catalog (None for dense retrieval).
+          dense : top-n by embedding cosine (the notebook's KNN pool)
+          hybrid: hard constraints (avoid_notes, disliked_accords, must_notes, must_accords) are
+                  resolved on the inverted index and excluded before scoring; the pool is the top-n
+                  by (1-α)·dense + α·sparse, where sparse is the X_sparse·q dot product.
+        `queries` are the build_query outputs used by encode(); rebuilt from `prefs` if omitted.
+        """
+        if retrieval not in RETRIEVALS:
+            raise ValueError(f"retrieval must be one of {RETRIEVALS}")
+        if retrieval == 'dense':
+            return [(ids, None) for ids in self.knn(ZQ, mode, n_neighbors)]
+
+        Z = self.bundle[f'Z_{mode}']
+        n = min(n_neighbors or self.knn_neighbors, Z.shape[0])
+        S = np.atleast_2d(ZQ) @ Z.T
+        if queries is None:
+            queries = [self.build_query(p) for p in prefs]
+        out = []
+        for row, pref in enumerate(prefs):
+            sp = self.index.score(*queries[row])
+            s = (1.0 - alpha_sparse) * S[row] + alpha_sparse * sp
+            k = n
+            allowed = self.index.constraint_mask(pref)
+            if allowed is not None:
+                s[~allowed] = -np.inf
+                k = min(n, int(allowed.sum()))
+            if k == 0:
+                out.append((np.zeros(0, dtype=np.int64), sp))
+                continue
+            part = np.argpartition(-s, k - 1)[:k]
+            out.append((part[np.argsort(-s[part], kind='stable')], sp))
+        return out
+
+    def prefilter_candidates(self, cand_ids: np.ndarray, preference: Dict[str, Any]) -> np.ndarray:
+        gender_pref = (preference.get("gender_focus") or "").strip().lower()
+        if not gender_pref:
+            return cand_ids
+        ok = np.array([gender_ok(g, gender_pref) for g in self.genders], dtype=bool)
+        keep = cand_ids[ok[self.item_gender_code[cand_ids]]]
+        return keep if keep.size else cand_ids
+
+    def _context_hits(self, cand_ids: np.ndarray, preference: Dict[str, Any]):
+        season = (preference.get("season") or "").strip().lower()
+        use_case = (preference.get("use_case") or "").strip().lower()
+        acc = self.item_accords[cand_ids]
+        hits = []
+        for masks in (self.season_masks.get(season), self.use_case_masks.get(use_case)):
+            if masks is not None:
+                hits.append((masks[0][acc].any(axis=1), masks[1][acc].any(axis=1)))
+        return hits
+
+    def inject_context_bias(self, rel_vec: np.ndarray, cand_ids: np.ndarray, preference: dict,
+                            bonus=0.01, penalty=0.01) -> np.ndarray:
+        """Light, optional pre-MMR nudge using season/use_case hints."""
+        rel = rel_vec.copy()
+        for boost, pen in self._context_hits(cand_ids, preference):
+            rel += bonus * boost
+            rel -= penalty * pen
+        return rel
+
+    def soft_context_rerank(self, selected_ids: List[int], preference: Dict[str, Any]) -> List[int]:
+        intensity = (preference.get("intensity") or "").strip().lower()
+        ids = np.asarray(selected_ids, dtype=np.int64)
+        scores = np.zeros(len(ids), dtype=np.float32)
+        for boost, pen in self._context_hits(ids, preference):
+            scores += 0.05 * boost
+            scores -= 0.05 * pen
+        if intensity in INTENSITY_WEIGHT:
+            scores += INTENSITY_WEIGHT[intensity]
+        order = np.argsort(-scores, kind="stable")
+        return [selected_ids[j] for j in order]
+
+    def rank(self, preference: dict, zq: np.ndarray, cand_ids: np.ndarray,
+             sparse_scores: np.ndarray = None,
+             mode: str = 'ae',
+             alpha_sparse: float = ALPHA_SPARSE,
+             top_k: int = CFG['topk'],
+             beta_persona: float = 0.35,
+             mmr_lambda: float = CFG['mmr_lambda'],
+             top_personas: int = 20,
+             temperature: float = 0.2,
+             use_context_bias: bool = True) -> List[Dict[str, Any]]:
+        """Scores, diversifies and reranks a retrieved candidate pool. Returns result records (see RESULT_COLS)."""
+        b = self.bundle
+        zqv = np.asarray(zq, dtype=np.float32).ravel()
+        cand_ids = self.prefilter_candidates(np.asarray(cand_ids, dtype=np.int64), preference)
+        if cand_ids.size == 0:
+            return []
+
+        Z_cand = b[f'Z_{mode}'][cand_ids]
+        rel_content = Z_cand @ zqv
+        if sparse_scores is not None:
+            rel_content = (1.0 - alpha_sparse) * rel_content + alpha_sparse * sparse_scores[cand_ids]
+        rel_persona = persona_boost(zqv, b[f'ZP_{mode}'], b[f'A_item_persona_{mode}'], cand_ids, top_personas, temperature)
+        rel_fused = (1.0 - beta_persona) * rel_content + beta_persona * rel_persona
+        if use_context_bias:
+            rel_fused = self.inject_context_bias(rel_fused, cand_ids, preference, bonus=0.02, penalty=0.02)
+
+        selected = mmr_from_relevance(rel_fused, Z_cand, cand_ids, lambda_relevance=mmr_lambda, top_k=top_k)
+        selected = self.soft_context_rerank(selected, preference)
+
+        pos = {int(cid): i for i, cid in enumerate(cand_ids)}
+        query_accords = {_norm(a.get('name', '')) for a in _as_list(preference.get('liked_accords_ranked')) if isinstance(a, dict)}
+        out = []
+        for i in selected:
+            i = int(i)
+            rec = self.item(i)
+            p = pos[i]
+            rec['score_content'] = float(rel_content[p])
+            rec['score_persona'] = float(rel_persona[p])
+            rec['score_fused'] = float(rel_fused[p])
+            accs = {self.accords[a] for a in self.item_accords[i] if a >= 0}
+            rec['why_accords_overlap'] = ', '.join(sorted(accs & query_accords))
+            rec['sample_notes'] = str(b['item_sample_notes'][i])
+            out.append(rec)
+        return out
+
+    def item(self, i: int) -> Dict[str, Any]:
+        b = self.bundle
+        rec = {}
+        for c in RESULT_COLS:
+            v = b.item_col(c)[i]
+            rec[c] = str(v) if v.dtype.kind == 'U' else v.item()
+        return rec
+
+    def cache_key(self, preference: dict, mode: str = 'ae', retrieval: str = 'hybrid',
+                  alpha_sparse: float = ALPHA_SPARSE, **rank_opts) -> str:
+        opts = {**RANK_DEFAULTS, **rank_opts}
+        opts = {k: type(RANK_DEFAULTS[k])(v) if k in RANK_DEFAULTS else v for k, v in opts.items()}
+        return cache_key(preference, self.version, mode=mode, retrieval=retrieval,
+                         alpha_sparse=float(alpha_sparse), **opts)
+
+    def recommend_records(self, preference: dict, mode: str = 'ae', retrieval: str = 'hybrid',
+                          alpha_sparse: float = ALPHA_SPARSE, **kwargs) -> List[Dict[str, Any]]:
+        if self.cache is None:
+            return self._recommend_records(preference, mode, retrieval, alpha_sparse, **kwargs)
+        key = self.cache_key(preference, mode, retrieval, alpha_sparse, **kwargs)
+        return self.cache.get_or_compute(
+            key, lambda: self._recommend_records(preference, mode, retrieval, alpha_sparse, **kwargs))
+
+    def _recommend_records(self, preference: dict, mode: str, retrieval: str, alpha_sparse: float,
+                           **kwargs) -> List[Dict[str, Any]]:
+        queries = [self.build_query(preference)]
+        zq = self.encode([preference], mode, queries)
+        cand_ids, sparse_scores = self.retrieve([preference], zq, mode, retrieval, alpha_sparse, queries=queries)[0]
+        return self.rank(preference, zq[0], cand_ids, sparse_scores, mode=mode, alpha_sparse=alpha_sparse, **kwargs)
+
+    def recommend(self, preference: dict,
+                  mode: str = 'ae',
+                  top_k: int = CFG['topk'],
+                  beta_persona: float = 0.35,
+                  mmr_lambda: float = CFG['mmr_lambda'],
+                  top_personas: int = 20,
+                  temperature: float = 0.2,
+                  use_context_bias: bool = True,
+                  retrieval: str = 'hybrid',
+                  alpha_sparse: float = ALPHA_SPARSE):
+        """
+        preference: dict with liked_accords_ranked, liked_notes_top/mid/base, and optional filters:
+          gender_focus ∈ {"men","women","unisex","any"}, season, use_case, intensity
+          hard constraints (hybrid retrieval): avoid_notes, disliked_accords, must_notes, must_accords
+        Returns a pandas DataFrame with the same columns as recommend() in Modelling.ipynb.
+        """
+        import pandas as pd
+
+        recs = self.recommend_records(preference, mode=mode, top_k=top_k, beta_persona=beta_persona,
+                                      mmr_lambda=mmr_lambda, top_personas=top_personas,
+                                      temperature=temperature, use_context_bias=use_context_bias,
+                                      retrieval=retrieval, alpha_sparse=alpha_sparse)
+        cols = RESULT_COLS + ['score_content', 'score_persona', 'score_fused', 'why_accords_overlap', 'sample_notes']
+        return pd.DataFrame.from_records(recs, columns=cols)
@@ -0,0 +1,288 @@
+"""
+result_cache.py
+---------------
+Response cache in front of Recommender.recommend_records() / recommend().
+
+Two tiers, both bounded by size in bytes and evicted least-recently-used first:
+- MemoryTier: per-process OrderedDict of serialized responses
+- SQLiteTier: optional shared file (WAL mode), so worker processes reuse each other's results
+
+Keys hash the canonical preference (list order and casing that can't change the result are
+normalized), every option that changes the result, and the bundle version, so a new bundle
+never serves stale entries. Concurrent misses on the same key in one process are coalesced
+(single-flight): one caller computes, the others wait for its result.
+"""
+from __future__ import annotations
+import json, time, sqlite3, hashlib, asyncio, threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+MEMORY_BYTES = 64 << 20
+DISK_BYTES = 512 << 20
+ATIME_RESOLUTION_S = 30.0   # disk hits refresh their LRU timestamp at most this often
+
+NOTE_KEYS = ("liked_notes_top", "liked_notes_mid", "liked_notes_base", "avoid_notes",
+             "disliked_accords", "must_notes", "must_accords")
+CONTEXT_KEYS = ("gender_focus", "season", "use_case", "intensity")
+
+def _names(x) -> list:
+    return [] if x is None else sorted(map(str, x))
+
+def canonical_preference(pref: dict) -> dict:
+    """
+    The parts of a preference the recommender reads, in a stable form:
+      - note/accord lists sorted (duplicates kept, they add weight)
+      - liked_accords_ranked sorted by rank; stable, so the first entry of a repeated rank still wins
+      - context fields stripped and lowercased, as the recommender compares them
+    """
+    out: Dict[str, Any] = {k: _names(pref.get(k)) for k in NOTE_KEYS}
+    ranked = [{"name": str(a.get("name", "")), "rank": int(a.get("rank", 0))}
+              for a in ([] if pref.get("liked_accords_ranked") is None else pref["liked_accords_ranked"])]
+    out["liked_accords_ranked"] = sorted(ranked, key=lambda a: a["rank"])
+    for k in CONTEXT_KEYS:
+        out[k] = (pref.get(k) or "").strip().lower()
+    return out
+
+def cache_key(preference: dict, version: str, **params) -> str:
+    """sha1 over the canonical preference, the request options and the bundle version."""
+    payload = {"v": version, "p": canonical_preference(preference), "o": params}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+class MemoryTier:
+    def __init__(self, max_bytes: int = MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            v = self._data.get(key)
+            if v is not None:
+                self._data.move_to_end(key)
+            return v
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._data[key] = value
+            self.bytes += len(value)
+            while self.bytes > self.max_bytes:
+                _, v = self._data.popitem(last=False)
+                self.bytes -= len(v)
+                self.evictions += 1
+
+class SQLiteTier:
+    """
+    Shared on-disk tier. The running byte total lives in a meta row updated in the same
+    transaction as each write, so eviction never has to scan the table.
+    """
+    def __init__(self, path: Path, max_bytes: int = DISK_BYTES):
+        self.path, self.max_bytes = Path(path), max_bytes
+        self.evictions = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(str(self.path), timeout=10.0, isolation_level=None, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL,
+                                                size INTEGER NOT NULL, atime REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_atime ON entries(atime);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta VALUES ('bytes', 0);
+        """)
+
+    @property
+    def bytes(self) -> int:
+        with self._lock:
+            return self._con.execute("SELECT value FROM meta WHERE name='bytes'").fetchone()[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._con.execute("SELECT value, atime FROM entries WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > ATIME_RESOLUTION_S:
+                self._con.execute("UPDATE entries SET atime=? WHERE key=?", (now, key))
+            return bytes(row[0])
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            con = self._con
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                old = con.execute("SELECT size FROM entries WHERE key=?", (key,)).fetchone()
+                con.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, value, len(value), time.time()))
+                con.execute("UPDATE meta SET value = value + ? WHERE name='bytes'", (len(value) - (old[0] if old else 0),))
+                total = con.execute("SELECT value FROM meta WHERE name='bytes'").fetchone()[0]
+                while total > self.max_bytes:
+                    victims = con.execute("SELECT key, size FROM entries ORDER BY atime LIMIT 64").fetchall()
+                    if not victims:
+                        break
+                    for k, size in victims:
+                        if total <= self.max_bytes:
+                            break
+                        con.execute("DELETE FROM entries WHERE key=?", (k,))
+                        total -= size
+                        self.evictions += 1
+                    con.execute("UPDATE meta SET value=? WHERE name='bytes'", (total,))
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+class _Call:
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value, self.error = None, None
+
+class ResultCache:
+    """
+    Memory tier, then the optional disk tier (hits are promoted to memory), then compute.
+    Values must be JSON-serializable; every hit returns a fresh copy.
+    """
+    def __init__(self, memory_bytes: int = MEMORY_BYTES, disk_path: Optional[Path] = None,
+                 disk_bytes: int = DISK_BYTES):
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = SQLiteTier(disk_path, disk_bytes) if disk_path else None
+        self.counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+        self._calls: Dict[str, _Call] = {}
+        self._acalls: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        raw = self.memory.get(key)
+        if raw is None:
+            return None
+        self._count("memory_hits")
+        return json.loads(raw)
+
+    def _disk_hit(self, key: str, raw: Optional[bytes]) -> Optional[Any]:
+        if raw is None:
+            return None
+        self._count("disk_hits")
+        self.memory.put(key, raw)
+        return json.loads(raw)
+
+    def get(self, key: str) -> Optional[Any]:
+        hit = self._memory_get(key)
+        if hit is None and self.disk is not None:
+            hit = self._disk_hit(key, self.disk.get(key))
+        return hit
+
+    def put(self, key: str, value: Any):
+        raw = json.dumps(value, separators=(',', ':')).encode()
+        self.memory.put(key, raw)
+        if self.disk is not None:
+            self.disk.put(key, raw)
+
+    # the disk tier can wait up to its busy timeout on another worker's write lock,
+    # so from a coroutine it runs on the default executor; the memory tier stays inline
+
+    async def aget(self, key: str) -> Optional[Any]:
+        hit = self._memory_get(key)
+        if hit is None and self.disk is not None:
+            raw = await asyncio.get_running_loop().run_in_executor(None, self.disk.get, key)
+            hit = self._disk_hit(key, raw)
+        return hit
+
+    async def aput(self, key: str, value: Any):
+        raw = json.dumps(value, separators=(',', ':')).encode()
+        self.memory.put(key, raw)
+        if self.disk is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.disk.put, key, raw)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Thread-safe lookup; concurrent misses on `key` run `compute` once."""
+        hit = self.get(key)
+        if hit is not None:
+            return hit
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.counts["misses"] += 1
+            else:
+                self.counts["coalesced"] += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return json.loads(json.dumps(call.value))
+        try:
+            call.value = compute()
+            self.put(key, call.value)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """get_or_compute for one event loop: concurrent misses on `key` await a single `compute()`."""
+        hit = await self.aget(key)
+        if hit is not None:
+            return hit
+        fut = self._acalls.get(key)
+        if fut is not None:
+            self._count("coalesced")
+            return json.loads(json.dumps(await asyncio.shield(fut)))
+        self._count("misses")
+        fut = self._acalls[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await compute()
+            await self.aput(key, value)
+            fut.set_result(value)
+            return value
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved, waiters (if any) still get it
+            raise
+        finally:
+            del self._acalls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self.counts)
+        hits = c["memory_hits"] + c["disk_hits"] + c["coalesced"]
+        total = hits + c["misses"]
+        c.update({
+            "requests": total,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.bytes,
+            "memory_evictions": self.memory.evictions,
+        })
+        if self.disk is not None:
+            c.update({"disk_bytes": self.disk.bytes, "disk_evictions": self.disk.evictions})
+        return c
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,416 @@
+"""
+service.py
+----------
+HTTP recommendation service (plain ASGI, served by uvicorn).
+
+Endpoints:
+- POST /recommend        {"preference": {...}, "mode": "ae", "retrieval": "hybrid", "top_k": 20, ...recommend() options}
+- POST /recommend/batch  {"requests": [<same body as /recommend>, ...]}
+- POST /similar          {"fragrance_id": "...", "mode": "ae", "top_k": 10}
+- GET  /healthz
+
+Each worker process memory-maps the same serving bundle (see bundle.py), so the embeddings
+and affinity matrices live once in the OS page cache no matter how many workers run.
+Inside a worker, concurrent requests are coalesced into micro-batches for the encoder and
+KNN step; when more than MAX_QUEUE requests are pending the service answers 503.
+/recommend responses are cached (see result_cache.py): an in-process LRU of CACHE_MB, plus a
+shared SQLite file when SCENTFINDER_CACHE_DB is set, so all workers reuse each other's hits.
+
+Usage (from src/Modelling):
+    python service.py --workers 4 --port 8000 --cache-db ../../data/processed/response_cache.sqlite
+"""
+from __future__ import annotations
+import os, json, math, time, asyncio, argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+
+from recommender import Recommender, CFG, RETRIEVALS, ALPHA_SPARSE
+from bundle import BUNDLE_DIR
+from result_cache import ResultCache
+
+BUNDLE_PATH = Path(os.getenv("SCENTFINDER_BUNDLE", str(BUNDLE_DIR)))
+MAX_BATCH = int(os.getenv("SCENTFINDER_MAX_BATCH", "32"))
+MAX_WAIT_MS = float(os.getenv("SCENTFINDER_MAX_WAIT_MS", "2"))
+MAX_QUEUE = int(os.getenv("SCENTFINDER_MAX_QUEUE", "256"))
+CACHE_MB = float(os.getenv("SCENTFINDER_CACHE_MB", "64"))          # 0 disables the cache
+CACHE_DB = os.getenv("SCENTFINDER_CACHE_DB", "")
+CACHE_DB_MB = float(os.getenv("SCENTFINDER_CACHE_DB_MB", "512"))
+MAX_BODY_BYTES = 1 << 20
+
+MODES = ('ae', 'svd')
+def parse_bool(v: Any) -> bool:
+    # bool("false") is True, so only JSON booleans and their spellings are accepted
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, str) and v.strip().lower() in ('true', 'false'):
+        return v.strip().lower() == 'true'
+    raise ValueError(f"not a boolean: {v!r}")
+
+def parse_float(v: Any) -> float:
+    # float() accepts "nan"/"inf", which would turn scores into NaN (not valid JSON)
+    x = float(v)
+    if not math.isfinite(x):
+        raise ValueError(f"not a finite number: {v!r}")
+    return x
+
+RANK_OPTIONS = {
+    'top_k': int, 'beta_persona': parse_float, 'mmr_lambda': parse_float,
+    'top_personas': int, 'temperature': parse_float, 'use_context_bias': parse_bool,
+    'alpha_sparse': parse_float,
+}
+# inclusive (min, max); None is unbounded
+RANK_BOUNDS = {
+    'top_k': (1, 200), 'beta_persona': (0.0, 1.0), 'mmr_lambda': (0.0, 1.0),
+    'top_personas': (1, None), 'temperature': (0.0, None), 'alpha_sparse': (0.0, 1.0),
+}
+NAME_LIST_FIELDS = ('liked_notes_top', 'liked_notes_mid', 'liked_notes_base', 'avoid_notes',
+                    'disliked_accords', 'must_notes', 'must_accords')
+CONTEXT_FIELDS = ('gender_focus', 'season', 'use_case', 'intensity')
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class Overloaded(HTTPError):
+    def __init__(self):
+        super().__init__(503, "queue full, retry later")
+
+def validate_preference(pref: dict):
+    """Checks the field shapes the recommender relies on, so bad input is a 400 rather than a 500."""
+    for k in NAME_LIST_FIELDS:
+        v = pref.get(k)
+        if v is not None and not (isinstance(v, list) and all(isinstance(x, str) for x in v)):
+            raise HTTPError(400, f"preference.{k} must be a list of strings")
+    for k in CONTEXT_FIELDS:
+        if pref.get(k) is not None and not isinstance(pref[k], str):
+            raise HTTPError(400, f"preference.{k} must be a string")
+    ranked = pref.get('liked_accords_ranked')
+    if ranked is None:
+        return
+    if not isinstance(ranked, list):
+        raise HTTPError(400, "preference.liked_accords_ranked must be a list of {name, rank} objects")
+    for entry in ranked:
+        if not isinstance(entry, dict) or not isinstance(entry.get('name', ''), str):
+            raise HTTPError(400, "preference.liked_accords_ranked must be a list of {name, rank} objects")
+        rank = entry.get('rank', 0)
+        if isinstance(rank, bool) or not isinstance(rank, (int, float, str)):
+            raise HTTPError(400, "liked_accords_ranked rank must be an integer")
+        try:
+            int(rank)
+        except (TypeError, ValueError, OverflowError):
+            raise HTTPError(400, "liked_accords_ranked rank must be an integer")
+
+def parse_request(body: Any) -> Tuple[dict, str, Dict[str, Any]]:
+    """Validates a /recommend body. Returns (preference, mode, rank options)."""
+    if not isinstance(body, dict) or not isinstance(body.get('preference'), dict):
+        raise HTTPError(400, "body must be an object with a 'preference' object")
+    validate_preference(body['preference'])
+    mode = body.get('mode', 'ae')
+    if mode not in MODES:
+        raise HTTPError(400, f"mode must be one of {list(MODES)}")
+    opts = {'retrieval': body.get('retrieval', 'hybrid')}
+    if opts['retrieval'] not in RETRIEVALS:
+        raise HTTPError(400, f"retrieval must be one of {list(RETRIEVALS)}")
+    for k, typ in RANK_OPTIONS.items():
+        if k in body:
+            try:
+                opts[k] = typ(body[k])
+            except (TypeError, ValueError, OverflowError):
+                raise HTTPError(400, f"invalid value for {k!r}")
+    for k, (lo, hi) in RANK_BOUNDS.items():
+        if k in opts and not ((lo is None or opts[k] >= lo) and (hi is None or opts[k] <= hi)):
+            raise HTTPError(400, f"{k} must be " + (f"between {lo} and {hi}" if hi is not None else f">= {lo}"))
+    return body['preference'], mode, opts
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests in one worker. The first queued request opens a window of
+    max_wait_ms (or until max_batch requests arrive); the whole window is then encoded and
+    run through KNN as one matrix product per mode, and ranked off the event loop.
+    """
+    def __init__(self, rec: Recommender, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS,
+                 max_queue: int = MAX_QUEUE):
+        self.rec = rec
+        self.max_batch, self.max_wait = max_batch, max_wait_ms / 1000.0
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.in_flight = 0
+        self.batches = 0
+        self.served = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        self.pool.shutdown(wait=False)
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() + self.in_flight
+
+    def free_slots(self) -> int:
+        return self.queue.maxsize - self.queue.qsize()
+
+    def submit(self, preference: dict, mode: str, opts: Dict[str, Any]) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((preference, mode, opts, fut))
+        except asyncio.QueueFull:
+            raise Overloaded()
+        return fut
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.in_flight = len(batch)
+            try:
+                results = await loop.run_in_executor(self.pool, self._run_batch, batch)
+                for (*_, fut), res in zip(batch, results):
+                    if fut.done():
+                        continue
+                    if isinstance(res, Exception):
+                        fut.set_exception(res)
+                    else:
+                        fut.set_result(res)
+            except Exception as e:
+                for *_, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            finally:
+                self.in_flight = 0
+                self.batches += 1
+                self.served += len(batch)
+
+    def _run_batch(self, batch) -> List[Any]:
+        results: List[Any] = [None] * len(batch)
+        groups: Dict[tuple, List[int]] = {}
+        for i, (_, mode, opts, _) in enumerate(batch):
+            key = (mode, opts.get('retrieval', 'hybrid'), opts.get('alpha_sparse', ALPHA_SPARSE))
+            groups.setdefault(key, []).append(i)
+        for (mode, retrieval, alpha), idx in groups.items():
+            prefs = [batch[i][0] for i in idx]
+            queries = [self.rec.build_query(p) for p in prefs]
+            ZQ = self.rec.encode(prefs, mode, queries)
+            pools = self.rec.retrieve(prefs, ZQ, mode, retrieval, alpha, queries=queries)
+            for row, i in enumerate(idx):
+                pref, _, opts, _ = batch[i]
+                rank_opts = {k: v for k, v in opts.items() if k != 'retrieval'}
+                try:
+                    results[i] = self.rec.rank(pref, ZQ[row], *pools[row], mode=mode, **rank_opts)
+                except Exception as e:
+                    results[i] = e
+        return results
+
+class Service:
+    def __init__(self, bundle_path: Path = BUNDLE_PATH):
+        self.bundle_path = bundle_path
+        self.rec: Recommender = None
+        self.batcher: MicroBatcher = None
+        self.cache: ResultCache = None
+        self._fid_index: Dict[str, int] = None
+        self.started = time.time()
+
+    async def startup(self):
+        self.rec = Recommender.load(self.bundle_path, mmap=True)
+        if CACHE_MB > 0:
+            self.cache = ResultCache(int(CACHE_MB * (1 << 20)), Path(CACHE_DB) if CACHE_DB else None,
+                                     int(CACHE_DB_MB * (1 << 20)))
+        self.batcher = MicroBatcher(self.rec)
+        self.batcher.start()
+
+    async def shutdown(self):
+        if self.batcher:
+            await self.batcher.stop()
+        if self.cache:
+            self.cache.close()
+
+    async def _recommend_one(self, pref: dict, mode: str, opts: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if self.cache is None:
+            return await self.batcher.submit(pref, mode, opts)
+        # the batcher ranks on its own thread, so the cache is consulted here rather than via rec.cache
+        key = self.rec.cache_key(pref, mode, **opts)
+        return await self.cache.aget_or_compute(key, lambda: self.batcher.submit(pref, mode, opts))
+
+    # ----- handlers -----
+
+    async def recommend(self, body: Any) -> Dict[str, Any]:
+        pref, mode, opts = parse_request(body)
+        results = await self._recommend_one(pref, mode, opts)
+        return {"version": self.rec.version, "results": results}
+
+    async def recommend_batch(self, body: Any) -> Dict[str, Any]:
+        reqs = body.get('requests') if isinstance(body, dict) else None
+        if not isinstance(reqs, list) or not reqs:
+            raise HTTPError(400, "body must be an object with a non-empty 'requests' list")
+        if len(reqs) > self.batcher.queue.maxsize:
+            raise HTTPError(413, f"batch of {len(reqs)} exceeds the limit of {self.batcher.queue.maxsize} requests")
+        parsed = [parse_request(r) for r in reqs]
+        # all-or-nothing admission, so a batch never half-fills the queue
+        if len(parsed) > self.batcher.free_slots():
+            raise Overloaded()
+        results = await asyncio.gather(*(self._recommend_one(*p) for p in parsed))
+        return {"version": self.rec.version, "results": list(results)}
+
+    async def similar(self, body: Any) -> Dict[str, Any]:
+        if not isinstance(body, dict) or not isinstance(body.get('fragrance_id'), str):
+            raise HTTPError(400, "body must be an object with a 'fragrance_id' string")
+        mode = body.get('mode', 'ae')
+        if mode not in MODES:
+            raise HTTPError(400, f"mode must be one of {list(MODES)}")
+        try:
+            top_k = int(body.get('top_k', 10))
+        except (TypeError, ValueError, OverflowError):
+            raise HTTPError(400, "invalid value for 'top_k'")
+        if not 1 <= top_k <= 200:
+            raise HTTPError(400, "top_k must be between 1 and 200")
+        if self._fid_index is None:
+            self._fid_index = {str(f): i for i, f in enumerate(self.rec.bundle.item_col('fragrance_id'))}
+        i = self._fid_index.get(body['fragrance_id'])
+        if i is None:
+            raise HTTPError(404, "unknown fragrance_id")
+        # KNN over the catalog is CPU-bound; keep it off the event loop, like the batcher's work
+        results = await asyncio.get_running_loop().run_in_executor(
+            self.batcher.pool, self._similar, i, mode, top_k)
+        return {"version": self.rec.version, "results": results}
+
+    def _similar(self, i: int, mode: str, top_k: int) -> List[Dict[str, Any]]:
+        Z = self.rec.bundle[f'Z_{mode}']
+        nbrs = self.rec.knn(np.asarray(Z[i:i+1]), mode, n_neighbors=top_k + 1)[0]
+        nbrs = [int(j) for j in nbrs if j != i][:top_k]
+        sims = Z[nbrs] @ Z[i]
+        results = []
+        for j, s in zip(nbrs, sims):
+            rec = self.rec.item(j)
+            rec['similarity'] = float(s)
+            results.append(rec)
+        return results
+
+    async def healthz(self, _body: Any) -> Dict[str, Any]:
+        ready = self.rec is not None
+        # stats() reads the disk tier, which may be waiting on another worker's write lock
+        cache = await asyncio.get_running_loop().run_in_executor(None, self.cache.stats) if self.cache else None
+        return {
+            "status": "ok" if ready else "starting",
+            "pid": os.getpid(),
+            "version": self.rec.version if ready else None,
+            "uptime_s": round(time.time() - self.started, 1),
+            "queue_depth": self.batcher.depth if ready else 0,
+            "batches": self.batcher.batches if ready else 0,
+            "served": self.batcher.served if ready else 0,
+            "cache": cache,
+        }
+
+    # ----- ASGI plumbing -----
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        routes = {
+            ('POST', '/recommend'): self.recommend,
+            ('POST', '/recommend/batch'): self.recommend_batch,
+            ('POST', '/similar'): self.similar,
+            ('GET', '/healthz'): self.healthz,
+        }
+        handler = routes.get((scope['method'], scope['path'].rstrip('/') or '/'))
+        try:
+            if handler is None:
+                raise HTTPError(404, "not found")
+            body = await self._read_json(receive) if scope['method'] == 'POST' else None
+            status, payload = 200, await handler(body)
+        except HTTPError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        await self._send_json(send, status, payload)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            msg = await receive()
+            if msg['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                    await send({'type': 'lifespan.startup.complete'})
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+            elif msg['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_json(self, receive) -> Any:
+        chunks, size = [], 0
+        while True:
+            msg = await receive()
+            chunk = msg.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, "request body too large")
+            chunks.append(chunk)
+            if not msg.get('more_body'):
+                break
+        try:
+            return json.loads(b''.join(chunks) or b'null')
+        except ValueError:
+            raise HTTPError(400, "invalid JSON")
+
+    async def _send_json(self, send, status: int, payload: Any):
+        body = json.dumps(payload).encode()
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if status == 503:
+            headers.append((b'retry-after', b'1'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+app = Service()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", type=str, default='127.0.0.1')
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=1, help='Worker processes (all share the mmapped bundle).')
+    ap.add_argument("--bundle", type=Path, default=BUNDLE_PATH)
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    ap.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    ap.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    ap.add_argument("--cache-mb", type=float, default=CACHE_MB, help='In-process response cache per worker (0 disables).')
+    ap.add_argument("--cache-db", type=str, default=CACHE_DB, help='SQLite file shared by all workers as a second cache tier.')
+    ap.add_argument("--cache-db-mb", type=float, default=CACHE_DB_MB)
+    args = ap.parse_args()
+
+    import uvicorn
+
+    # workers are separate processes, so settings travel through the environment
+    os.environ.update({
+        "SCENTFINDER_BUNDLE": str(args.bundle.resolve()),
+        "SCENTFINDER_MAX_BATCH": str(args.max_batch),
+        "SCENTFINDER_MAX_WAIT_MS": str(args.max_wait_ms),
+        "SCENTFINDER_MAX_QUEUE": str(args.max_queue),
+        "SCENTFINDER_CACHE_MB": str(args.cache_mb),
+        "SCENTFINDER_CACHE_DB": str(Path(args.cache_db).resolve()) if args.cache_db else "",
+        "SCENTFINDER_CACHE_DB_MB": str(args.cache_db_mb),
+    })
+    uvicorn.run("service:app", host=args.host, port=args.port, workers=args.workers,
+                log_level='warning', access_log=False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+streaming_svd.py
+----------------
+Refit of the SVD embedding (svd_pipe.joblib, svd_embeddings.npy) that streams X_sparse in CSR
+row blocks instead of handing the whole matrix to TruncatedSVD.
+
+Randomized subspace iteration on XᵀX (Halko, Martinsson & Tropp, 2011):
+- every pass multiplies one row block at a time, Y_b = X_b·Q, and only keeps the D×l sums
+  Σ X_bᵀY_b (next subspace) and Σ Y_bᵀY_b (Rayleigh–Ritz), so memory is O(D·l + block·l)
+  however many items there are
+- blocks are spread over a thread pool; each thread returns partial sums that are reduced
+- a previous svd_pipe.joblib seeds the start subspace (warm start), and passes stop once the
+  top-k Ritz values settle, which usually takes one or two passes after a small catalog update
+
+The result is written back as the same TruncatedSVD + Normalizer pipeline the notebook
+produces, so bundle.py and the notebook load it unchanged. drift_report() compares the new
+embeddings with the current ones.
+
+Usage (from src/Modelling):
+    python streaming_svd.py --warm-start --threads 8            # fit + drift report only
+    python streaming_svd.py --warm-start --threads 8 --write     # also replace the SVD artifacts
+"""
+from __future__ import annotations
+import os, json, time, argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, Callable, Iterable, Iterator, Tuple
+
+import numpy as np
+from scipy import sparse
+
+ART = Path('../../data/processed')
+
+CFG = {
+    "n_components": 256,    # = CFG['embed_dim'] in Modelling.ipynb
+    "n_oversamples": 10,
+    "max_iter": 5,
+    "tol": 1e-4,            # relative change of the top-k Ritz values that ends the iteration
+    "block_rows": 4096,
+    "seed": 42,
+}
+
+Block = Tuple[int, sparse.csr_matrix]
+
+def iter_blocks(X: sparse.csr_matrix, block_rows: int = CFG['block_rows']) -> Iterator[Block]:
+    """(first row, CSR row block) pairs covering X in order."""
+    X = X.tocsr()
+    for start in range(0, X.shape[0], block_rows):
+        yield start, X[start:start + block_rows]
+
+def _bounded_map(fn: Callable, blocks: Iterable[Block], threads: int) -> Iterator:
+    """fn(start, block) over the stream in order, keeping at most 2×threads blocks in flight."""
+    if threads <= 1:
+        for start, b in blocks:
+            yield fn(start, b)
+        return
+    with ThreadPoolExecutor(threads) as ex:
+        pending = deque()
+        for start, b in blocks:
+            pending.append(ex.submit(fn, start, b))
+            if len(pending) >= 2 * threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _map_reduce(fn: Callable, blocks: Iterable[Block], threads: int) -> tuple:
+    """Elementwise sum of the tuples fn(start, block) returns."""
+    total = None
+    for part in _bounded_map(fn, blocks, threads):
+        total = part if total is None else tuple(a + b for a, b in zip(total, part))
+    return total
+
+def _orth(A: np.ndarray) -> np.ndarray:
+    return np.linalg.qr(A)[0]
+
+def _flip_signs(V: np.ndarray) -> np.ndarray:
+    # deterministic signs: the largest-magnitude loading of every component is positive
+    signs = np.sign(V[np.argmax(np.abs(V), axis=0), np.arange(V.shape[1])])
+    signs[signs == 0] = 1.0
+    return V * signs
+
+def fit(blocks: Callable[[], Iterable[Block]], n_features: int,
+        n_components: int = CFG['n_components'],
+        n_oversamples: int = CFG['n_oversamples'],
+        max_iter: int = CFG['max_iter'],
+        tol: float = CFG['tol'],
+        init: np.ndarray = None,
+        threads: int = None,
+        seed: int = CFG['seed']) -> Dict[str, Any]:
+    """
+    Top-k right singular vectors of the matrix streamed by `blocks()` (called once per pass).
+    init: (k0×D) components to warm start from, e.g. the previous svd_pipe's components_.
+    Returns components (k×D), singular_values, explained_variance(_ratio), n_samples, n_passes.
+    """
+    threads = threads or os.cpu_count() or 1
+    l = min(n_components + n_oversamples, n_features)
+    rng = np.random.default_rng(seed)
+    Omega = rng.standard_normal((n_features, l))
+    if init is not None:
+        k0 = min(init.shape[0], l)
+        Omega[:, :k0] = np.asarray(init[:k0], dtype=np.float64).T
+    Q = _orth(Omega)
+
+    def with_stats(_, b):
+        Y = b @ Q
+        sq = b.multiply(b)
+        return (np.asarray(b.T @ Y), Y.T @ Y, np.asarray(b.sum(axis=0)).ravel(),
+                np.asarray(sq.sum(axis=0)).ravel(), np.array([b.shape[0]]))
+
+    def step(_, b):
+        Y = b @ Q
+        return np.asarray(b.T @ Y), Y.T @ Y
+
+    prev = None
+    for it in range(max_iter + 1):
+        if it == 0:
+            W, G, col_sum, col_sq, n = _map_reduce(with_stats, blocks(), threads)
+        else:
+            W, G = _map_reduce(step, blocks(), threads)
+        evals, evecs = np.linalg.eigh(G)          # G = QᵀXᵀXQ, ascending eigenvalues
+        top = evals[::-1][:n_components]
+        if prev is not None and np.max(np.abs(top - prev)) <= tol * max(top[0], 1e-12):
+            break
+        if it == max_iter:
+            break
+        prev = top
+        Q = _orth(W)
+
+    order = np.argsort(evals)[::-1][:n_components]
+    V = _flip_signs(Q @ evecs[:, order])          # D×k
+    s = np.sqrt(np.maximum(evals[order], 0.0))
+
+    # explained variance from streamed column stats: var(X·v) = σ²/n − (mean(X)·v)²
+    n = int(n[0])
+    mean = col_sum / n
+    exp_var = s ** 2 / n - (mean @ V) ** 2
+    full_var = float((col_sq / n - mean ** 2).sum())
+    return {
+        "components": V.T.astype(np.float32),
+        "singular_values": s.astype(np.float32),
+        "explained_variance": exp_var.astype(np.float32),
+        "explained_variance_ratio": (exp_var / full_var).astype(np.float32),
+        "n_samples": n,
+        "n_passes": it + 1,
+    }
+
+def embed(blocks: Iterable[Block], components: np.ndarray, n_rows: int, threads: int = None,
+          out: np.ndarray = None) -> np.ndarray:
+    """L2-normalized X·componentsᵀ, block by block (same as svd_pipe.transform). `out` may be a memmap."""
+    threads = threads or os.cpu_count() or 1
+    Ct = np.ascontiguousarray(components.T, dtype=np.float32)
+    out = np.empty((n_rows, Ct.shape[1]), dtype=np.float32) if out is None else out
+
+    def one(start, b):
+        Z = np.asarray(b @ Ct, dtype=np.float32)
+        nrm = np.linalg.norm(Z, axis=1, keepdims=True)
+        nrm[nrm == 0.0] = 1.0
+        out[start:start + Z.shape[0]] = Z / nrm
+
+    for _ in _bounded_map(one, blocks, threads):
+        pass
+    return out
+
+def to_pipeline(res: Dict[str, Any], seed: int = CFG['seed']):
+    """Wraps a fit() result as the notebook's make_pipeline(TruncatedSVD, Normalizer)."""
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import Normalizer
+
+    k, D = res['components'].shape
+    svd = TruncatedSVD(n_components=k, random_state=seed)
+    svd.components_ = res['components']
+    svd.singular_values_ = res['singular_values']
+    svd.explained_variance_ = res['explained_variance']
+    svd.explained_variance_ratio_ = res['explained_variance_ratio']
+    svd.n_features_in_ = D
+    return make_pipeline(svd, Normalizer(copy=False).fit(np.zeros((1, k), dtype=np.float32)))
+
+def drift_report(Z_old: np.ndarray, Z_new: np.ndarray, C_old: np.ndarray, C_new: np.ndarray,
+                 n_sample: int = 1000, k_nn: int = 10, seed: int = CFG['seed']) -> Dict[str, Any]:
+    """
+    How far a refit moved from the current model:
+      - subspace_cos_*: cosines of the principal angles between old and new components
+      - item_cos_raw_mean: per-item cosine as stored; low values mean persona embeddings and
+        A_item_persona_svd must be recomputed with the new components
+      - item_cos_aligned_*: per-item cosine after the best rotation of the new basis onto the old
+      - knn_overlap_at_k: share of each sampled item's k nearest neighbours that are unchanged
+    """
+    rep: Dict[str, Any] = {}
+    if C_old.shape[1] == C_new.shape[1]:
+        cos = np.clip(np.linalg.svd(C_old.astype(np.float64) @ C_new.T.astype(np.float64), compute_uv=False), 0.0, 1.0)
+        rep.update({"subspace_cos_mean": float(cos.mean()), "subspace_cos_min": float(cos.min())})
+    if Z_old.shape != Z_new.shape:
+        rep["note"] = f"embedding shapes differ ({Z_old.shape} vs {Z_new.shape}); item-level drift skipped"
+        return rep
+
+    rep["item_cos_raw_mean"] = float(np.einsum('ij,ij->i', Z_old, Z_new).mean())
+    U, _, Vt = np.linalg.svd(Z_new.T.astype(np.float64) @ Z_old.astype(np.float64))
+    Z_rot = Z_new @ (U @ Vt).astype(np.float32)
+    Z_rot /= np.linalg.norm(Z_rot, axis=1, keepdims=True) + 1e-9
+    cos = np.einsum('ij,ij->i', Z_old, Z_rot)
+    rep.update({"item_cos_aligned_mean": float(cos.mean()), "item_cos_aligned_p5": float(np.percentile(cos, 5))})
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(Z_old.shape[0], size=min(n_sample, Z_old.shape[0]), replace=False)
+    def nbrs(Z):
+        S = Z[rows] @ Z.T
+        S[np.arange(rows.size), rows] = -np.inf
+        return np.argpartition(-S, k_nn, axis=1)[:, :k_nn]
+    a, b = nbrs(Z_old), nbrs(Z_new)
+    rep[f"knn_overlap_at_{k_nn}"] = float(np.mean([np.intersect1d(x, y).size / k_nn for x, y in zip(a, b)]))
+    return rep
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--components", type=int, default=CFG['n_components'])
+    ap.add_argument("--oversamples", type=int, default=CFG['n_oversamples'])
+    ap.add_argument("--max-iter", type=int, default=CFG['max_iter'])
+    ap.add_argument("--tol", type=float, default=CFG['tol'])
+    ap.add_argument("--block-rows", type=int, default=CFG['block_rows'])
+    ap.add_argument("--threads", type=int, default=os.cpu_count())
+    ap.add_argument("--warm-start", action='store_true', help='Start from the components in svd_pipe.joblib.')
+    ap.add_argument("--write", action='store_true',
+                    help='Replace svd_pipe.joblib, svd_embeddings.npy and the persona SVD embeddings.')
+    ap.add_argument("--art", type=Path, default=ART)
+    args = ap.parse_args()
+
+    from joblib import load, dump
+
+    X = sparse.load_npz(args.art/'X_sparse.npz').tocsr()
+    old_pipe = load(args.art/'svd_pipe.joblib') if (args.art/'svd_pipe.joblib').exists() else None
+    C_old = old_pipe.steps[0][1].components_ if old_pipe is not None else None
+    init = C_old if args.warm_start and C_old is not None and C_old.shape[1] == X.shape[1] else None
+    if args.warm_start and init is None:
+        print("warm start skipped: no svd_pipe.joblib with a matching feature space")
+
+    t0 = time.perf_counter()
+    res = fit(lambda: iter_blocks(X, args.block_rows), X.shape[1], n_components=args.components,
+              n_oversamples=args.oversamples, max_iter=args.max_iter, tol=args.tol, init=init,
+              threads=args.threads)
+    Z = embed(iter_blocks(X, args.block_rows), res['components'], X.shape[0], threads=args.threads)
+    print(f"fit {X.shape} -> k={args.components} in {time.perf_counter() - t0:.1f}s, "
+          f"{res['n_passes']} passes, explained variance {res['explained_variance_ratio'].sum():.3f}")
+
+    old_emb = args.art/'svd_embeddings.npy'
+    if C_old is not None and old_emb.exists():
+        report = drift_report(np.load(old_emb).astype(np.float32), Z, C_old, res['components'])
+        report.update({"n_passes": res['n_passes'], "warm_start": init is not None})
+        (args.art/'svd_drift.json').write_text(json.dumps(report, indent=2))
+        print(json.dumps(report, indent=2))
+
+    if args.write:
+        dump(to_pipeline(res), args.art/'svd_pipe.joblib')
+        np.save(args.art/'svd_embeddings.npy', Z)
+        P = args.art/'personas_csr.npz'
+        if P.exists():
+            P = sparse.load_npz(P).tocsr()
+            ZP = embed(iter_blocks(P, args.block_rows), res['components'], P.shape[0], threads=args.threads)
+            np.save(args.art/'persona_svd_embeddings.npy', ZP)
+            # stale item x persona affinities; bundle.compile_bundle recomputes them when missing
+            (args.art/'A_item_persona_svd.npy').unlink(missing_ok=True)
+        print("wrote svd_pipe.joblib, svd_embeddings.npy, persona_svd_embeddings.npy; recompile the bundle")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+stub_llm.py
+-----------
+Local OpenAI-compatible stub for POST /v1/chat/completions, used to exercise PersonaGenerator
+without an API key. It reads the persona count and ALLOWED_* lists from the prompt and returns
+random personas drawn from them, with optional latency and failure injection (HTTP 429/500)
+to exercise the retry path.
+
+Usage (from src/Modelling):
+    python stub_llm.py --port 8099 --latency-ms 300 --fail-rate 0.2
+    python PersonaGenerator.py --n 200 --base-url http://127.0.0.1:8099/v1 --prefix personas_stub
+"""
+import os, re, ast, json, time, random, asyncio, argparse
+
+from PersonaGenerator import GENDER_CHOICES, SEASON_CHOICES, USE_CASE_CHOICES, INTENSITY_CHOICES
+
+LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "200"))
+FAIL_RATE = float(os.getenv("STUB_FAIL_RATE", "0"))
+
+def parse_prompt(prompt: str):
+    m = re.search(r"array of (\d+) persona", prompt)
+    n = int(m.group(1)) if m else 1
+    vocab = {}
+    for key in ('ACCORDS', 'TOP', 'MID', 'BASE'):
+        m = re.search(rf"^ALLOWED_{key}\s*=\s*(\[.*\])\s*$", prompt, re.M)
+        vocab[key.lower()] = ast.literal_eval(m.group(1)) if m else []
+    return n, vocab
+
+def fake_persona(rng: random.Random, vocab) -> dict:
+    def pick(xs, lo, hi):
+        return rng.sample(xs, min(len(xs), rng.randint(lo, hi))) if xs else []
+    liked = pick(vocab['accords'], 5, 5)
+    disliked = [a for a in pick(vocab['accords'], 0, 3) if a not in liked]
+    top, mid, base = pick(vocab['top'], 5, 10), pick(vocab['mid'], 5, 10), pick(vocab['base'], 5, 10)
+    liked_notes = set(top) | set(mid) | set(base)
+    pool = vocab['top'] + vocab['mid'] + vocab['base']
+    return {
+        "liked_accords_ranked": [{"name": a, "rank": i + 1} for i, a in enumerate(liked)],
+        "disliked_accords": disliked,
+        "liked_notes_top": top, "liked_notes_mid": mid, "liked_notes_base": base,
+        "avoid_notes": [n for n in pick(pool, 0, 5) if n not in liked_notes],
+        "gender_focus": rng.choice(GENDER_CHOICES),
+        "season": rng.choice(SEASON_CHOICES),
+        "use_case": rng.choice(USE_CASE_CHOICES),
+        "intensity": rng.choice(INTENSITY_CHOICES),
+    }
+
+def completion(model: str, content: str) -> dict:
+    return {
+        "id": f"stub-{random.getrandbits(48):x}", "object": "chat.completion",
+        "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+async def app(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+    body = b''
+    while True:
+        msg = await receive()
+        body += msg.get('body', b'')
+        if not msg.get('more_body'):
+            break
+
+    status, payload = 404, {"error": {"message": "not found"}}
+    if scope['method'] == 'POST' and scope['path'].endswith('/chat/completions'):
+        await asyncio.sleep(LATENCY_MS / 1000.0 * random.uniform(0.5, 1.5))
+        if random.random() < FAIL_RATE:
+            status, payload = random.choice([429, 500]), {"error": {"message": "injected failure"}}
+        else:
+            req = json.loads(body)
+            n, vocab = parse_prompt(req['messages'][-1]['content'])
+            rng = random.Random()
+            content = json.dumps({"personas": [fake_persona(rng, vocab) for _ in range(n)]})
+            status, payload = 200, completion(req.get('model', 'stub'), content)
+
+    data = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(data)).encode())]})
+    await send({'type': 'http.response.body', 'body': data})
+
+def main():
+    global LATENCY_MS, FAIL_RATE
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    ap.add_argument("--fail-rate", type=float, default=FAIL_RATE)
+    args = ap.parse_args()
+
+    import uvicorn
+
+    LATENCY_MS, FAIL_RATE = args.latency_ms, args.fail_rate
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()